@@ -2,7 +2,8 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import Group
 
-from foodgram.models import Ingredient, Recipe, Tag, User
+from foodgram.caching import RECIPES_VERSION_KEY, bump_version
+from foodgram.models import Ingredient, Recipe, RecipeTag, Tag, User
 
 
 @admin.register(Tag)
@@ -23,6 +24,7 @@ class AdminUser(UserAdmin):
         'email',
         'first_name',
         'last_name',
+        'recipes_count',
     )
     search_fields = ('email', 'username',)
     list_filter = ('email', 'username',)
@@ -40,23 +42,32 @@ class IngridiendAdmin(admin.ModelAdmin):
     empty_value_display = '-пусто-'
 
 
+class RecipeTagInline(admin.TabularInline):
+    model = RecipeTag
+    extra = 1
+    verbose_name = 'Тег'
+    verbose_name_plural = 'Теги'
+
+
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     list_display = (
         'pk',
         'name',
         'author',
-        'favorites_count'
+        'favorites_count',
+        'shopping_cart_count'
     )
     search_fields = ('author', 'name',)
     list_filter = ('tags',)
     empty_value_display = '-пусто-'
-    readonly_fields = ('favorites_count',)
-
-    def favorites_count(self, obj):
-        return obj.favorited_by.all().count()
+    readonly_fields = ('favorites_count', 'shopping_cart_count')
+    inlines = (RecipeTagInline,)
 
-    favorites_count.short_description = 'Добавлений в избранное'
+    def save_related(self, request, form, formsets, change):
+        # Строки RecipeTag из inline не отправляют m2m_changed.
+        super().save_related(request, form, formsets, change)
+        bump_version(RECIPES_VERSION_KEY)
 
 
 admin.site.unregister(Group)
@@ -5,3 +5,6 @@ class FoodgramConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'foodgram'
     verbose_name = 'Foodgram'
+
+    def ready(self):
+        from foodgram import checks, signals  # noqa: F401
@@ -0,0 +1,266 @@
+"""Асинхронные представления для самых нагруженных GET-запросов.
+
+Подключаются в urls.py при ASYNC_READ_VIEWS=True и имеют смысл только
+под ASGI-сервером (uvicorn или gunicorn с UvicornWorker). Запись,
+курсорная пагинация и ошибки валидации передаются синхронным
+представлениям DRF, поэтому ответы API не меняются.
+"""
+from functools import wraps
+from math import ceil
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import Http404, HttpResponse
+from django.shortcuts import redirect
+from django.urls import path
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from foodgram.caching import (RECIPES_VERSION_KEY, aget_version,
+                              build_response_cache_key,
+                              finalize_cached_response, get_etag)
+from foodgram.filters import IngredientSearchFilter, RecipeFilter
+from foodgram.ingredient_search import asearch_ingredients, catalog
+from foodgram.models import Ingredient, Recipe
+from foodgram.paginations import FoodgramPagination, KeysetPagination
+from foodgram.serializers import IngredientSerializer, RecipeSerializer
+from foodgram.short_links import aresolve_short_code
+from foodgram.tag_catalog import catalog as tag_catalog
+from foodgram.tag_catalog import finalize_catalog_response
+from foodgram.views import IngredientViewSet, RecipeViewSet, TagViewSet
+
+
+def json_response(data):
+    return HttpResponse(
+        JSONRenderer().render(data), content_type='application/json'
+    )
+
+
+async def aget_user(request):
+    """Аутентификация по токену через асинхронный ORM.
+
+    None означает недействительный токен: такой запрос отдаётся
+    синхронному представлению, чтобы ответ об ошибке совпадал с DRF.
+    """
+    header = request.headers.get('Authorization', '').split()
+    if not header:
+        return AnonymousUser()
+    if len(header) != 2 or header[0].lower() != 'token':
+        return None
+    try:
+        token = await Token.objects.select_related('user').aget(
+            key=header[1]
+        )
+    except Token.DoesNotExist:
+        return None
+    return token.user if token.user.is_active else None
+
+
+async def load_subscriptions(request):
+    """Заполняет кеш подписок на запросе для UserSerializer."""
+    if request.user.is_authenticated:
+        request._subscribed_ids = {
+            author_id async for author_id
+            in request.user.follower.values_list(
+                'author_id', flat=True
+            ).aiterator()
+        }
+
+
+def async_read_view(sync_view):
+    """Обрабатывает GET асинхронно, остальное — синхронным sync_view.
+
+    Обработчик может вернуть None, чтобы передать запрос sync_view.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        async def view(request, *args, **kwargs):
+            if request.method == 'GET':
+                user = await aget_user(request)
+                if user is not None:
+                    request.user = user
+                    response = await handler(request, *args, **kwargs)
+                    if response is not None:
+                        return response
+            return await sync_to_async(sync_view)(request, *args, **kwargs)
+
+        # Как и у представлений DRF: CSRF проверяет аутентификация.
+        view.csrf_exempt = True
+        return view
+    return decorator
+
+
+async def cached_response(request, build):
+    """Асинхронный аналог CachedResponseMixin с теми же ключами кеша."""
+    if request.user.is_authenticated:
+        data = await build(request)
+        return None if data is None else json_response(data)
+    key = build_response_cache_key(
+        request, await aget_version(RECIPES_VERSION_KEY)
+    )
+    cached = await cache.aget(key)
+    if cached is None:
+        data = await build(request)
+        if data is None:
+            return None
+        etag = get_etag(data)
+        await cache.aset(key, (etag, data), RecipeViewSet.cache_timeout)
+    else:
+        etag, data = cached
+    return finalize_cached_response(request, json_response(data), etag)
+
+
+async def get_serializer_context(request):
+    """Справочник тегов загружается в потоке: в цикле событий
+    сериализатор уже не обращается к базе за тегами."""
+    return {
+        'request': request,
+        'tag_index': await sync_to_async(tag_catalog.get_index)(),
+    }
+
+
+def get_recipes(request):
+    return Recipe.objects.with_related().with_user_flags(request.user)
+
+
+def get_page_size(request):
+    try:
+        page_size = int(
+            request.GET[FoodgramPagination.page_size_query_param]
+        )
+    except (KeyError, ValueError):
+        return FoodgramPagination.page_size
+    if page_size <= 0:
+        return FoodgramPagination.page_size
+    return min(page_size, FoodgramPagination.max_page_size)
+
+
+def filter_recipes(request):
+    """Фильтр author загружает автора из базы при валидации,
+    поэтому фильтрация выполняется синхронно в отдельном потоке."""
+    filterset = RecipeFilter(
+        request.GET, queryset=get_recipes(request), request=request
+    )
+    return filterset.qs if filterset.is_valid() else None
+
+
+async def build_recipe_list(request):
+    queryset = await sync_to_async(filter_recipes)(request)
+    if queryset is None:
+        return None
+    page_size = get_page_size(request)
+    count = await queryset.acount()
+    pages = max(ceil(count / page_size), 1)
+    try:
+        page = int(request.GET.get(FoodgramPagination.page_query_param, 1))
+    except ValueError:
+        return None
+    if not 1 <= page <= pages:
+        return None
+    offset = (page - 1) * page_size
+    # async for выполняет запрос вместе с prefetch_related в потоке.
+    recipes = [
+        recipe async for recipe in queryset[offset:offset + page_size]
+    ]
+    await load_subscriptions(request)
+    url = request.build_absolute_uri()
+    page_param = FoodgramPagination.page_query_param
+    previous = None
+    if page == 2:
+        previous = remove_query_param(url, page_param)
+    elif page > 2:
+        previous = replace_query_param(url, page_param, page - 1)
+    return {
+        'count': count,
+        'next': (
+            replace_query_param(url, page_param, page + 1)
+            if page < pages else None
+        ),
+        'previous': previous,
+        'results': RecipeSerializer(
+            recipes, many=True, context={
+                **await get_serializer_context(request),
+                'list_thumbnails': True,
+            }
+        ).data,
+    }
+
+
+@async_read_view(RecipeViewSet.as_view(
+    {'get': 'list', 'post': 'create'}, basename='recipes', detail=False
+))
+async def recipe_list(request):
+    if KeysetPagination.cursor_query_param in request.GET:
+        return None
+    return await cached_response(request, build_recipe_list)
+
+
+@async_read_view(RecipeViewSet.as_view(
+    {
+        'get': 'retrieve',
+        'put': 'update',
+        'patch': 'partial_update',
+        'delete': 'destroy',
+    },
+    basename='recipes',
+    detail=True
+))
+async def recipe_detail(request, pk):
+    async def build(request):
+        try:
+            recipe = await get_recipes(request).aget(pk=pk)
+        except Recipe.DoesNotExist:
+            return None
+        await load_subscriptions(request)
+        return RecipeSerializer(
+            recipe, context=await get_serializer_context(request)
+        ).data
+
+    return await cached_response(request, build)
+
+
+@async_read_view(TagViewSet.as_view(
+    {'get': 'list'}, basename='tags', detail=False
+))
+async def tag_list(request):
+    index = await sync_to_async(tag_catalog.get_index)()
+    return finalize_catalog_response(
+        request, json_response(index.data), index
+    )
+
+
+@async_read_view(IngredientViewSet.as_view(
+    {'get': 'list'}, basename='ingredients', detail=False
+))
+async def ingredient_list(request):
+    query = request.GET.get(IngredientSearchFilter.search_param, '').strip()
+    if query:
+        ingredients = await asearch_ingredients(
+            Ingredient.objects.all(), query
+        )
+    elif settings.INGREDIENT_CATALOG_IN_MEMORY:
+        ingredients = (await sync_to_async(catalog.get_index)()).items
+    else:
+        ingredients = [
+            ingredient async for ingredient in Ingredient.objects.aiterator()
+        ]
+    return json_response(IngredientSerializer(ingredients, many=True).data)
+
+
+async def short_url_redirect(request, code):
+    recipe_id = await aresolve_short_code(code)
+    if recipe_id is None:
+        raise Http404
+    return redirect(f'/recipes/{recipe_id}')
+
+
+urlpatterns = [
+    path('api/recipes/', recipe_list),
+    path('api/recipes/<int:pk>/', recipe_detail),
+    path('api/tags/', tag_list),
+    path('api/ingredients/', ingredient_list),
+    path('s/<str:code>/', short_url_redirect),
+]
@@ -0,0 +1,371 @@
+"""Синтетические данные и сценарии для замеров горячих путей API.
+
+Используется командой benchmark и тестами бюджета SQL-запросов.
+Всё работает локально: на SQLite или на Postgres без доступа к сети.
+"""
+import io
+import itertools
+import json
+import random
+import statistics
+import time
+from collections import namedtuple
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from foodgram.ingredient_search import catalog
+from foodgram.models import (Favorite, FeedEntry, Ingredient, IngredientRecipe,
+                             Recipe, ShoppingCart, Subscription, Tag)
+from foodgram.recipe_search import update_search_vectors
+from foodgram.tag_catalog import catalog as tag_catalog
+
+# Параметры генерации: favorites, shopping_cart и subscriptions —
+# число связей на одного пользователя.
+SCALES = {
+    'small': {
+        'users': 20, 'recipes': 100, 'ingredients': 300,
+        'ingredients_per_recipe': 6, 'tags': 5,
+        'favorites': 10, 'shopping_cart': 5, 'subscriptions': 5,
+    },
+    'medium': {
+        'users': 200, 'recipes': 2000, 'ingredients': 2000,
+        'ingredients_per_recipe': 8, 'tags': 8,
+        'favorites': 30, 'shopping_cart': 10, 'subscriptions': 10,
+    },
+    'large': {
+        'users': 2000, 'recipes': 20000, 'ingredients': 5000,
+        'ingredients_per_recipe': 10, 'tags': 12,
+        'favorites': 50, 'shopping_cart': 15, 'subscriptions': 20,
+    },
+}
+
+BATCH_SIZE = 1000
+PAYLOAD_TAGS = 2
+PAYLOAD_INGREDIENTS = 6
+MATCH_INGREDIENTS = 20
+
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAgMAAABieywa'
+    'AAAACVBMVEUAAAD///9fX1/S0ecCAAAACXBIWXMAAA7EAAAOxAGVKw4bAAAACklEQV'
+    'QImWNoAAAAggCByxOyYQAAAABJRU5ErkJggg=='
+)
+
+# path и data могут ссылаться на данные, подготовленные в BenchmarkData:
+# path — шаблон str.format, data — функция от BenchmarkData.
+# budget — допустимое число SQL-запросов при холодном кеше,
+# settings — настройки, с которыми выполняется сценарий.
+Scenario = namedtuple(
+    'Scenario', 'name method path data status budget settings',
+    defaults=(None,)
+)
+
+SCENARIOS = (
+    Scenario('recipe_list', 'get', '/api/recipes/', None, 200, 5),
+    Scenario(
+        'recipe_list_tags', 'get', '/api/recipes/?tags={data.tag}',
+        None, 200, 5
+    ),
+    Scenario(
+        'recipe_list_author', 'get', '/api/recipes/?author={data.author}',
+        None, 200, 6
+    ),
+    Scenario(
+        'recipe_list_favorited', 'get', '/api/recipes/?is_favorited=1',
+        None, 200, 5
+    ),
+    Scenario(
+        'recipe_list_shopping_cart', 'get',
+        '/api/recipes/?is_in_shopping_cart=1', None, 200, 5
+    ),
+    Scenario(
+        'recipe_list_popular', 'get',
+        '/api/recipes/?ordering=-favorites_count', None, 200, 5
+    ),
+    Scenario(
+        'recipe_list_cursor', 'get', '/api/recipes/?cursor=', None, 200, 4
+    ),
+    Scenario(
+        'recipe_list_anonymous', 'get', '/api/recipes/', None, 200, 4
+    ),
+    Scenario(
+        'recipe_search', 'get',
+        '/api/recipes/?search={data.search_query}', None, 200, 5
+    ),
+    Scenario(
+        'recipe_match', 'get',
+        '/api/recipes/match/?ingredients={data.match_ingredients}',
+        None, 200, 5
+    ),
+    # Обе стратегии ленты на одних данных: FeedEntry заполняется
+    # в generate_data независимо от FEED_STRATEGY.
+    Scenario(
+        'feed_fan_out_on_read', 'get', '/api/recipes/feed/?cursor=',
+        None, 200, 4, {'FEED_STRATEGY': 'read'}
+    ),
+    Scenario(
+        'feed_fan_out_on_write', 'get', '/api/recipes/feed/?cursor=',
+        None, 200, 4, {'FEED_STRATEGY': 'write'}
+    ),
+    Scenario(
+        'recipe_detail', 'get', '/api/recipes/{data.recipe}/', None, 200, 4
+    ),
+    Scenario(
+        'subscriptions', 'get',
+        '/api/users/subscriptions/?recipes_limit=3', None, 200, 3
+    ),
+    Scenario(
+        'download_shopping_cart', 'get',
+        '/api/recipes/download_shopping_cart/', None, 200, 1
+    ),
+    Scenario(
+        'ingredient_search', 'get',
+        '/api/ingredients/?name={data.ingredient_prefix}', None, 200, 2
+    ),
+    # В бюджет записи входит пересчёт поисковых данных после фиксации:
+    # один запрос в PostgreSQL и три в остальных СУБД.
+    Scenario(
+        'recipe_create', 'post', '/api/recipes/',
+        lambda data: data.recipe_payload(), 201, 20
+    ),
+    Scenario(
+        'recipe_update', 'patch', '/api/recipes/{data.recipe}/',
+        lambda data: data.recipe_payload(), 200, 24
+    ),
+)
+
+
+def get_ingredient_names(count):
+    """Названия из поставляемого справочника, дальше — синтетические."""
+    path = Path(settings.BASE_DIR) / 'foodgram' / 'ingredients.json'
+    with open(path, encoding='utf-8') as file:
+        items = json.load(file)[:count]
+    for number in range(len(items), count):
+        items.append({
+            'name': f'ингредиент {number}', 'measurement_unit': 'г'
+        })
+    return items
+
+
+def sample_pairs(rng, users, objects, per_user, exclude_self=False):
+    for user in users:
+        candidates = [
+            obj for obj in rng.sample(
+                objects, min(per_user + 1, len(objects))
+            )
+            if not (exclude_self and obj.pk == user.pk)
+        ]
+        for obj in candidates[:per_user]:
+            yield user, obj
+
+
+@transaction.atomic
+def generate_data(seed=0, **scale):
+    """Заполняет базу синтетическими данными заданного размера.
+
+    Объекты создаются через bulk_create без сигналов, поэтому счётчики
+    пересчитываются командой reconcile_counters, а кеши сбрасываются.
+    """
+    scale = {**SCALES['small'], **scale}
+    rng = random.Random(seed)
+    User = get_user_model()
+    password = make_password(None)
+    users = User.objects.bulk_create(
+        [
+            User(
+                username=f'bench_{number}',
+                email=f'bench_{number}@example.com',
+                first_name='Имя',
+                last_name='Фамилия',
+                password=password
+            )
+            for number in range(scale['users'])
+        ],
+        batch_size=BATCH_SIZE
+    )
+    tags = Tag.objects.bulk_create([
+        Tag(name=f'Тег {number}', slug=f'tag-{number}')
+        for number in range(scale['tags'])
+    ])
+    ingredients = Ingredient.objects.bulk_create(
+        [Ingredient(**item) for item in get_ingredient_names(
+            scale['ingredients']
+        )],
+        batch_size=BATCH_SIZE
+    )
+    recipes = Recipe.objects.bulk_create(
+        [
+            Recipe(
+                author=rng.choice(users),
+                name=f'Рецепт {number}',
+                text='Описание рецепта',
+                cooking_time=rng.randint(5, 180),
+                short_url=Recipe._generate_short_code()
+            )
+            for number in range(scale['recipes'])
+        ],
+        batch_size=BATCH_SIZE
+    )
+    IngredientRecipe.objects.bulk_create(
+        [
+            IngredientRecipe(
+                recipe=recipe, ingredient=ingredient,
+                amount=rng.randint(1, 500)
+            )
+            for recipe in recipes
+            for ingredient in rng.sample(
+                ingredients,
+                min(scale['ingredients_per_recipe'], len(ingredients))
+            )
+        ],
+        batch_size=BATCH_SIZE
+    )
+    RecipeTag = Recipe.tags.through
+    RecipeTag.objects.bulk_create(
+        [
+            RecipeTag(recipe=recipe, tag=tag)
+            for recipe in recipes
+            for tag in rng.sample(tags, min(2, len(tags)))
+        ],
+        batch_size=BATCH_SIZE
+    )
+    for model, objects, per_user, field in (
+        (Favorite, recipes, scale['favorites'], 'recipe'),
+        (ShoppingCart, recipes, scale['shopping_cart'], 'recipe'),
+        (Subscription, users, scale['subscriptions'], 'author'),
+    ):
+        model.objects.bulk_create(
+            [
+                model(user=user, **{field: obj})
+                for user, obj in sample_pairs(
+                    rng, users, objects, per_user,
+                    exclude_self=model is Subscription
+                )
+            ],
+            batch_size=BATCH_SIZE
+        )
+    call_command('reconcile_counters', stdout=io.StringIO())
+    update_search_vectors(Recipe.objects.all())
+    FeedEntry.objects.rebuild()
+    transaction.on_commit(cache.clear)
+    transaction.on_commit(catalog.invalidate)
+    return BenchmarkData(users[0], tags, ingredients)
+
+
+class BenchmarkData:
+    """Объекты, на которые ссылаются сценарии."""
+
+    def __init__(self, user, tags, ingredients):
+        self.user = user
+        self.tag = tags[0].slug
+        self.author = (
+            Recipe.objects.order_by('-author__recipes_count')
+            .values_list('author', flat=True).first()
+        )
+        self.ingredient_prefix = ingredients[0].name[:3]
+        self.search_query = ingredients[0].name.split()[0]
+        self.match_ingredients = ','.join(
+            str(ingredient.pk)
+            for ingredient in ingredients[:MATCH_INGREDIENTS]
+        )
+        self.recipe = Recipe.objects.create(
+            author=user,
+            name='Рецепт для замеров',
+            text='Описание рецепта',
+            cooking_time=30
+        ).pk
+        # Два непересекающихся состава: при обновлении рецепт каждый раз
+        # меняется целиком, и число запросов не зависит от случая.
+        self.payloads = itertools.cycle([
+            self.build_payload(tags[offset::2], ingredients[offset::2])
+            for offset in (0, 1)
+        ])
+
+    @staticmethod
+    def build_payload(tags, ingredients):
+        return {
+            'name': 'Рецепт для замеров',
+            'text': 'Описание рецепта',
+            'cooking_time': 30,
+            'image': IMAGE,
+            'tags': [tag.pk for tag in tags[:PAYLOAD_TAGS]],
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': 100}
+                for ingredient in ingredients[:PAYLOAD_INGREDIENTS]
+            ],
+        }
+
+    def recipe_payload(self):
+        return next(self.payloads)
+
+
+def get_client(scenario, data):
+    client = APIClient()
+    if scenario.name != 'recipe_list_anonymous':
+        client.force_authenticate(user=data.user)
+    return client
+
+
+def run_once(scenario, data, client, warm_cache=False):
+    """Выполняет сценарий; возвращает время в мс и число SQL-запросов."""
+    if not warm_cache:
+        cache.clear()
+        # Справочник тегов живёт в памяти воркера и переживает запросы.
+        tag_catalog.get_index()
+    path = scenario.path.format(data=data)
+    payload = scenario.data(data) if scenario.data else None
+    with override_settings(**scenario.settings or {}), \
+            CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        response = getattr(client, scenario.method)(
+            path, payload, format='json'
+        )
+        if response.streaming:
+            b''.join(response.streaming_content)
+        elapsed = time.perf_counter() - started
+    if response.status_code != scenario.status:
+        raise AssertionError(
+            f'{scenario.name}: {scenario.method.upper()} {path} вернул '
+            f'{response.status_code} вместо {scenario.status}'
+        )
+    return elapsed * 1000, len(queries.captured_queries)
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+def run_scenario(scenario, data, repeat, warm_cache=False):
+    client = get_client(scenario, data)
+    # Первый прогон прогревает импорты и соединение и в замер не входит.
+    run_once(scenario, data, client, warm_cache)
+    timings = []
+    queries = 0
+    for _ in range(repeat):
+        elapsed, queries = run_once(scenario, data, client, warm_cache)
+        timings.append(elapsed)
+    return {
+        'min_ms': round(min(timings), 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'max_ms': round(max(timings), 3),
+        'queries': queries,
+        'query_budget': scenario.budget,
+        'within_budget': queries <= scenario.budget,
+    }
+
+
+def run_benchmarks(data, repeat, names=None, warm_cache=False):
+    return {
+        scenario.name: run_scenario(scenario, data, repeat, warm_cache)
+        for scenario in SCENARIOS
+        if not names or scenario.name in names
+    }
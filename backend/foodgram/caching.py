@@ -0,0 +1,114 @@
+from hashlib import md5
+from urllib.parse import urlencode
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from foodgram import constants
+
+RECIPES_VERSION_KEY = 'recipes_version'
+# Кеши, которые не видны другим процессам: версии, записанные в них,
+# не доходят до остальных воркеров.
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def uses_shared_cache(alias='default'):
+    return settings.CACHES[alias]['BACKEND'] not in LOCAL_CACHE_BACKENDS
+
+
+def get_version(key):
+    return cache.get_or_set(key, uuid4().hex, None)
+
+
+async def aget_version(key):
+    return await cache.aget_or_set(key, uuid4().hex, None)
+
+
+def bump_version(key):
+    """Меняет версию после фиксации транзакции: старые ключи
+    перестают использоваться и вытесняются по таймауту."""
+    transaction.on_commit(lambda: cache.set(key, uuid4().hex, None))
+
+
+def build_response_cache_key(request, version):
+    """Ключ строится по схеме, хосту, пути и отсортированным параметрам:
+    в ответах есть абсолютные ссылки на соседние страницы.
+
+    Общий для синхронных и асинхронных представлений, поэтому они
+    пользуются одними и теми же записями кеша.
+    """
+    query = urlencode(sorted(
+        (key, value)
+        for key in request.GET
+        for value in request.GET.getlist(key)
+    ))
+    raw_key = f'{request.build_absolute_uri(request.path)}?{query}'
+    return 'response:{}:{}'.format(
+        version, md5(raw_key.encode()).hexdigest()
+    )
+
+
+def get_etag(data):
+    return quote_etag(md5(JSONRenderer().render(data)).hexdigest())
+
+
+def finalize_cached_response(request, response, etag):
+    """Добавляет ETag и Vary, а при совпадении If-None-Match
+    подменяет ответ на 304."""
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    response['ETag'] = etag
+    patch_vary_headers(response, ('Authorization',))
+    return response
+
+
+class CachedResponseMixin:
+    """Кеширует ответы list и retrieve для анонимных пользователей.
+
+    Ответы сопровождаются ETag и при совпадении If-None-Match
+    возвращается 304.
+    """
+    cache_version_key = None
+    cache_timeout = constants.RESPONSE_CACHE_TIMEOUT
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def get_response_cache_key(self, request):
+        return build_response_cache_key(
+            request, get_version(self.cache_version_key)
+        )
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return handler(request, *args, **kwargs)
+        key = self.get_response_cache_key(request)
+        cached = cache.get(key)
+        if cached is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            etag = get_etag(response.data)
+            cache.set(key, (etag, response.data), self.cache_timeout)
+        else:
+            etag, data = cached
+            response = Response(data)
+        return finalize_cached_response(request, response, etag)
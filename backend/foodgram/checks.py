@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.checks import Error, Warning, register
+
+from foodgram.caching import uses_shared_cache
+
+
+@register()
+def ingredient_catalog_check(app_configs, **kwargs):
+    """Каталог ингредиентов в памяти сбрасывается по версии в кеше,
+    поэтому без общего кеша воркеры не узнают об изменениях."""
+    if settings.INGREDIENT_CATALOG_IN_MEMORY and not uses_shared_cache():
+        return [Error(
+            'INGREDIENT_CATALOG_IN_MEMORY требует общего кеша.',
+            hint=(
+                'Задайте CACHE_BACKEND (например, Redis или Memcached) '
+                'или выключите INGREDIENT_CATALOG_IN_MEMORY.'
+            ),
+            id='foodgram.E001',
+        )]
+    return []
+
+
+@register()
+def shared_cache_check(app_configs, **kwargs):
+    """Кеш ответов, справочник тегов и списки покупок сбрасываются
+    сменой версии в кеше. LocMemCache у каждого воркера свой, и смена
+    версии в одном воркере не видна остальным."""
+    backend = settings.CACHES['default']['BACKEND']
+    if backend != 'django.core.cache.backends.locmem.LocMemCache':
+        return []
+    return [Warning(
+        'Кеш ответов, справочник тегов и списки покупок хранятся '
+        'в памяти одного процесса.',
+        hint=(
+            'При нескольких воркерах задайте CACHE_BACKEND (например, '
+            'Redis или Memcached), иначе изменения доходят до других '
+            'воркеров только по истечении таймаута. С одним воркером '
+            'предупреждение можно отключить в SILENCED_SYSTEM_CHECKS.'
+        ),
+        id='foodgram.W001',
+    )]
@@ -3,3 +3,23 @@ REGULAR_EXPRESSIONS = r'^[\w.@+-]+$'
 MAX_LENGHT_EMAIL = 254
 MEASUREMENT_LEN = 10
 SHORT_URL_LEN = 8
+SHOPPING_LIST_CACHE_TIMEOUT = 60 * 60 * 24
+STREAM_CHUNK_SIZE = 8192
+PDF_FONT_SIZE = 12
+PDF_LINE_HEIGHT = 18
+PDF_MARGIN = 50
+INGREDIENTS_BATCH_SIZE = 1000
+INGREDIENT_SEARCH_LIMIT = 50
+RESPONSE_CACHE_TIMEOUT = 60 * 10
+BULK_RECIPES_LIMIT = 100
+SHORT_URL_ATTEMPTS = 5
+SHORT_LINK_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+SHORT_LINK_MISSING_TIMEOUT = 60
+RECIPE_THUMBNAIL_SIZE = (480, 480)
+AVATAR_SIZE = (256, 256)
+SLOW_REQUEST_TOP_QUERIES = 5
+TAG_CATALOG_MAX_AGE = 60 * 60
+TAG_CATALOG_SNAPSHOT_TTL = 60
+RECIPE_SEARCH_MAX_LENGTH = 200
+MATCH_INGREDIENTS_LIMIT = 100
+MAX_PAGE_SIZE = 100
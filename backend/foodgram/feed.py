@@ -0,0 +1,31 @@
+"""Лента рецептов от авторов, на которых подписан пользователь.
+
+Две стратегии выбираются настройкой FEED_STRATEGY:
+
+* read (fan-out-on-read) — рецепты выбираются по подпискам при каждом
+  запросе, страница каждого автора читается по индексу
+  (author, -pub_date, -id);
+* write (fan-out-on-write) — при публикации рецепт копируется в ленты
+  подписчиков (FeedEntry), и страница ленты — один проход по индексу
+  (user, -pub_date, -recipe) независимо от числа подписок.
+"""
+from django.conf import settings
+from django.db.models import F
+
+from foodgram.models import Subscription
+from foodgram.paginations import FeedKeysetPagination, KeysetPagination
+
+
+def use_fan_out_on_write():
+    return settings.FEED_STRATEGY == 'write'
+
+
+def get_feed(queryset, user):
+    """Рецепты ленты пользователя и пагинация по курсору для них."""
+    if use_fan_out_on_write():
+        return queryset.filter(feed_entries__user=user).annotate(
+            feed_pub_date=F('feed_entries__pub_date')
+        ), FeedKeysetPagination()
+    return queryset.filter(author__in=Subscription.objects.filter(
+        user=user
+    ).values('author')), KeysetPagination()
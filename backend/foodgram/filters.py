@@ -1,6 +1,53 @@
+from django import forms
+from django.db.models import Exists, OuterRef
+from django_filters.constants import EMPTY_VALUES
 from django_filters.rest_framework import FilterSet, filters
+from django_filters.widgets import QueryArrayWidget
+from rest_framework.filters import BaseFilterBackend
 
-from foodgram.models import Recipe
+from foodgram.ingredient_search import search_ingredients
+from foodgram.models import Favorite, Recipe, RecipeTag, ShoppingCart
+from foodgram.recipe_search import search_recipes
+from foodgram.tag_catalog import get_tag_ids
+
+
+class StableOrderingFilter(filters.OrderingFilter):
+    """Добавляет -id, чтобы порядок при равных счётчиках не менялся.
+
+    ?ordering=-favorites_count читает индекс по (-favorites_count, -id)
+    вместо агрегации по таблице избранного.
+    """
+
+    def filter(self, qs, value):
+        if value in EMPTY_VALUES:
+            return qs
+        ordering = [self.get_ordering_value(param) for param in value]
+        return qs.order_by(*ordering, '-id')
+
+
+class SlugListField(forms.Field):
+    widget = QueryArrayWidget
+
+    def to_python(self, value):
+        return [slug for slug in value or () if slug]
+
+
+class TagsFilter(filters.Filter):
+    """Рецепты хотя бы с одним из тегов ?tags=a&tags=b.
+
+    Слаги переводятся в id по кешированному справочнику, а условие
+    строится через EXISTS по индексу (tag, recipe): нет ни запроса
+    вариантов выбора, ни JOIN, из-за которого рецепты повторялись бы.
+    Неизвестные слаги ничего не находят.
+    """
+    field_class = SlugListField
+
+    def filter(self, qs, value):
+        if not value:
+            return qs
+        return qs.filter(Exists(RecipeTag.objects.filter(
+            recipe=OuterRef('pk'), tag_id__in=get_tag_ids(value)
+        )))
 
 
 class RecipeFilter(FilterSet):
@@ -8,22 +55,45 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_in_shopping_cart'
     )
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = TagsFilter()
+    search = filters.CharFilter(method='filter_search')
+    ordering = StableOrderingFilter(
+        fields=('pub_date', 'favorites_count', 'shopping_cart_count')
+    )
 
     class Meta:
         model = Recipe
-        fields = ['author', 'tags', 'is_favorited', 'is_in_shopping_cart']
+        # search до ordering: явный ?ordering= заменяет сортировку
+        # по релевантности.
+        fields = [
+            'author', 'tags', 'is_favorited', 'is_in_shopping_cart',
+            'search', 'ordering'
+        ]
+
+    def filter_user_relation(self, queryset, model, value):
+        user = self.request.user
+        if value and user.is_authenticated:
+            return queryset.filter(Exists(model.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )))
+        return queryset
 
     def filter_is_favorited(self, queryset, name, value):
+        return self.filter_user_relation(queryset, Favorite, value)
 
-        if value and self.request.user.is_authenticated:
-            result = queryset.filter(favorited_by__user=self.request.user)
-            return result
+    def filter_in_shopping_cart(self, queryset, name, value):
+        return self.filter_user_relation(queryset, ShoppingCart, value)
 
-        return queryset
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
 
-    def filter_in_shopping_cart(self, queryset, name, value):
-        user = self.request.user
-        if value and user.is_authenticated:
-            return queryset.filter(in_shopping_carts__user=user)
-        return queryset
+
+class IngredientSearchFilter(BaseFilterBackend):
+    """Поиск ингредиентов по началу названия для автодополнения."""
+    search_param = 'name'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        return search_ingredients(queryset, query)
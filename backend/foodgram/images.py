@@ -0,0 +1,118 @@
+import hashlib
+import io
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from drf_extra_fields.fields import Base64ImageField
+
+from foodgram.caching import RECIPES_VERSION_KEY, bump_version
+
+logger = logging.getLogger(__name__)
+
+RENDITION_NAME = re.compile(r'_\d+x\d+\.\w+$')
+RENDITION_FORMATS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+
+class HashedBase64ImageField(Base64ImageField):
+    """Base64ImageField, называющий файл по SHA-256 содержимого."""
+
+    def get_file_name(self, decoded_file):
+        return hashlib.sha256(decoded_file).hexdigest()
+
+
+def get_rendition_name(name, size):
+    """Имя уменьшенной копии детерминировано: по нему видно, готова ли
+    она, а одинаковые исходники дают один файл."""
+    if RENDITION_NAME.search(name):
+        return name
+    stem = os.path.splitext(name)[0]
+    extension = RENDITION_FORMATS[settings.IMAGE_RENDITION_FORMAT]
+    return f'{stem}_{size[0]}x{size[1]}.{extension}'
+
+
+def render_image(file, size):
+    from PIL import Image, ImageOps
+
+    with Image.open(file) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(size)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        if settings.IMAGE_RENDITION_FORMAT == 'JPEG':
+            image = image.convert('RGB')
+        buffer = io.BytesIO()
+        image.save(
+            buffer,
+            settings.IMAGE_RENDITION_FORMAT,
+            quality=settings.IMAGE_RENDITION_QUALITY
+        )
+    return buffer.getvalue()
+
+
+def build_rendition(model, pk, source_field, target_field, size):
+    """Создаёт уменьшенную копию изображения и записывает её имя в модель.
+
+    Запись условная: если исходник успели заменить, результат
+    отбрасывается, а новую копию построит следующая задача.
+    """
+    instance = model.objects.filter(pk=pk).only(source_field).first()
+    source = instance and getattr(instance, source_field)
+    if not source:
+        return
+    storage = source.storage
+    name = get_rendition_name(source.name, size)
+    if not storage.exists(name):
+        with storage.open(source.name) as file:
+            content = render_image(file, size)
+        name = storage.save(name, ContentFile(content))
+    if model.objects.filter(
+        pk=pk, **{source_field: source.name}
+    ).update(**{target_field: name}):
+        bump_version(RECIPES_VERSION_KEY)
+
+
+class ImagePipeline:
+    """Пул потоков для обработки изображений вне запроса.
+
+    Локальная замена очереди задач: задачи ставятся после фиксации
+    транзакции и выполняются в фоновых потоках воркера. При
+    IMAGE_PIPELINE_SYNC задачи выполняются сразу, что удобно в тестах
+    и management-командах.
+    """
+
+    def __init__(self):
+        self.executor = None
+
+    def get_executor(self):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_PIPELINE_WORKERS,
+                thread_name_prefix='images'
+            )
+        return self.executor
+
+    def run(self, task, *args):
+        try:
+            task(*args)
+        except Exception:
+            logger.exception('Ошибка обработки изображения')
+        finally:
+            if not settings.IMAGE_PIPELINE_SYNC:
+                # У каждого потока своё соединение с базой.
+                connections.close_all()
+
+    def submit(self, task, *args):
+        if settings.IMAGE_PIPELINE_SYNC:
+            transaction.on_commit(lambda: self.run(task, *args))
+        else:
+            transaction.on_commit(
+                lambda: self.get_executor().submit(self.run, task, *args)
+            )
+
+
+pipeline = ImagePipeline()
@@ -0,0 +1,32 @@
+"""Подбор рецептов по ингредиентам, которые есть у пользователя.
+
+Покрытие рецепта — доля его ингредиентов из переданного набора.
+Оно считается одним агрегирующим запросом: строки состава с нужными
+ингредиентами читаются по индексу ingredient_id и группируются по
+рецепту, а знаменателем служит счётчик Recipe.ingredients_count.
+Остальной состав рецептов при подборе не читается.
+"""
+from django.db.models import Count, F, FloatField
+from django.db.models.functions import Cast, Greatest
+
+
+def match_recipes(queryset, ingredient_ids, min_coverage=0):
+    """Рецепты хотя бы с одним из ингредиентов, от полностью покрытых.
+
+    При равном покрытии выше рецепт с большим числом совпадений.
+    """
+    # filter() до annotate(): Count считает только строки состава,
+    # прошедшие условие на ингредиенты.
+    return queryset.filter(
+        recipe_ingredients__ingredient_id__in=list(ingredient_ids)
+    ).annotate(
+        ingredients_matched=Count('recipe_ingredients')
+    ).annotate(
+        coverage=(
+            Cast('ingredients_matched', FloatField())
+            # Устаревший счётчик не даёт деления на ноль и покрытия > 1.
+            / Greatest(F('ingredients_count'), F('ingredients_matched'))
+        )
+    ).filter(
+        coverage__gte=min_coverage
+    ).order_by('-coverage', '-ingredients_matched', '-pub_date', '-id')
@@ -0,0 +1,162 @@
+from bisect import bisect_left
+from difflib import SequenceMatcher
+from uuid import uuid4
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+
+from foodgram import constants
+from foodgram.models import Ingredient
+
+
+class IngredientIndex:
+    """Отсортированный по названию массив ингредиентов в памяти процесса.
+
+    Поиск по префиксу — бинарный поиск и проход до первого несовпадения.
+    """
+
+    def __init__(self, ingredients):
+        self.items = sorted(
+            ingredients, key=lambda ingredient: ingredient.name.upper()
+        )
+        self.keys = [ingredient.name.upper() for ingredient in self.items]
+        self.by_id = {ingredient.id: ingredient for ingredient in self.items}
+
+    def search(self, query, limit, fuzzy=False):
+        query = query.upper()
+        results = []
+        for position in range(bisect_left(self.keys, query), len(self.keys)):
+            if not self.keys[position].startswith(query):
+                break
+            results.append(self.items[position])
+            if len(results) == limit:
+                return results
+        if fuzzy:
+            results += self.search_fuzzy(query, limit - len(results))
+        return results
+
+    def search_fuzzy(self, query, limit):
+        """Вхождение в середине названия, ранжированное по похожести."""
+        matches = sorted(
+            (
+                (-SequenceMatcher(None, query, key).ratio(), key, item)
+                for key, item in zip(self.keys, self.items)
+                if query in key and not key.startswith(query)
+            ),
+            key=lambda match: match[:2]
+        )
+        return [item for _, _, item in matches[:limit]]
+
+
+class IngredientCatalog:
+    """Каталог ингредиентов в памяти процесса.
+
+    Версия каталога хранится в общем кеше: при изменении ингредиентов
+    она меняется, и каждый воркер перестраивает свой индекс при следующем
+    обращении. На горячем пути база данных не используется.
+    """
+    version_key = 'ingredient_catalog_version'
+
+    def __init__(self):
+        self.index = None
+        self.version = None
+
+    def get_index(self):
+        version = cache.get_or_set(self.version_key, uuid4().hex, None)
+        if self.index is None or self.version != version:
+            self.index = IngredientIndex(Ingredient.objects.all())
+            self.version = version
+        return self.index
+
+    def warm_up(self):
+        """Строит каталог при старте воркера, если он включён."""
+        if not settings.INGREDIENT_CATALOG_IN_MEMORY:
+            return
+        try:
+            self.get_index()
+        except DatabaseError:
+            # База ещё недоступна: каталог построится при первом запросе.
+            pass
+
+    def invalidate(self):
+        """Сбрасывает каталог во всех воркерах после фиксации транзакции."""
+        self.index = None
+        transaction.on_commit(
+            lambda: cache.set(self.version_key, uuid4().hex, None)
+        )
+
+
+catalog = IngredientCatalog()
+
+
+def prefix_queryset(queryset, query):
+    return queryset.filter(name__istartswith=query)
+
+
+def fuzzy_queryset(queryset, query):
+    from django.contrib.postgres.search import TrigramWordSimilarity
+
+    return queryset.filter(
+        name__trigram_word_similar=query
+    ).exclude(
+        name__istartswith=query
+    ).annotate(
+        similarity=TrigramWordSimilarity(query, 'name')
+    ).order_by('-similarity', 'name')
+
+
+def search_database(queryset, query, limit, fuzzy=False):
+    """Поиск в PostgreSQL.
+
+    Префикс ищется через UPPER(name) LIKE 'X%' по индексу
+    text_pattern_ops, вхождения — оператором <% по GIN-индексу pg_trgm.
+    """
+    results = list(prefix_queryset(queryset, query)[:limit])
+    if fuzzy and len(results) < limit:
+        results += fuzzy_queryset(queryset, query)[:limit - len(results)]
+    return results
+
+
+async def asearch_database(queryset, query, limit, fuzzy=False):
+    results = [
+        ingredient async for ingredient
+        in prefix_queryset(queryset, query)[:limit].aiterator()
+    ]
+    if fuzzy and len(results) < limit:
+        results += [
+            ingredient async for ingredient in fuzzy_queryset(
+                queryset, query
+            )[:limit - len(results)].aiterator()
+        ]
+    return results
+
+
+def use_database_search():
+    return (
+        connection.vendor == 'postgresql'
+        and not settings.INGREDIENT_CATALOG_IN_MEMORY
+    )
+
+
+def search_ingredients(queryset, query, limit=None):
+    """Автодополнение ингредиентов с жёстким ограничением выдачи."""
+    limit = limit or constants.INGREDIENT_SEARCH_LIMIT
+    fuzzy = settings.INGREDIENT_SEARCH_FUZZY
+    if use_database_search():
+        return search_database(queryset, query, limit, fuzzy)
+    return catalog.get_index().search(query, limit, fuzzy)
+
+
+async def asearch_ingredients(queryset, query, limit=None):
+    """Асинхронный вариант search_ingredients.
+
+    Каталог в памяти перестраивается синхронным кодом в отдельном потоке.
+    """
+    limit = limit or constants.INGREDIENT_SEARCH_LIMIT
+    fuzzy = settings.INGREDIENT_SEARCH_FUZZY
+    if use_database_search():
+        return await asearch_database(queryset, query, limit, fuzzy)
+    index = await sync_to_async(catalog.get_index)()
+    return index.search(query, limit, fuzzy)
@@ -0,0 +1,187 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+from django.utils.functional import SimpleLazyObject
+
+from foodgram import constants
+from foodgram.metrics import registry
+
+logger = logging.getLogger('foodgram.slow_requests')
+
+# Статистика текущего запроса. ContextVar копируется в потоки
+# sync_to_async, поэтому запросы асинхронных представлений тоже учитываются.
+current_stats = ContextVar('request_stats', default=None)
+
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+WHITESPACE = re.compile(r'\s+')
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.statements = Counter()
+
+
+def fingerprint(sql):
+    """Запрос без параметров: списки IN сворачиваются, чтобы одинаковые
+    по форме запросы попадали в одну группу."""
+    return WHITESPACE.sub(' ', IN_LIST.sub('IN (...)', sql)).strip()
+
+
+def record_query(execute, sql, params, many, context):
+    """Обёртка выполнения запросов, подключается к каждому соединению."""
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_time += time.perf_counter() - started
+        stats.queries += 1
+        stats.statements[sql] += 1
+
+
+def install_query_recorder(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class ProfiledSerializerMixin:
+    """Учитывает время сериализации в статистике запроса.
+
+    Вложенные сериализаторы не считаются повторно: время меряется
+    только на внешнем уровне.
+    """
+
+    def to_representation(self, instance):
+        stats = current_stats.get()
+        if stats is None or stats.serializer_depth:
+            return super().to_representation(instance)
+        stats.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            stats.serializer_time += time.perf_counter() - started
+            stats.serializer_depth -= 1
+
+
+def get_view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unknown'
+
+
+def get_response_size(response):
+    if response.streaming:
+        return 0
+    return len(response.content)
+
+
+def shows_server_timing(request):
+    """Server-Timing раскрывает число запросов к базе, поэтому
+    отдаётся только при DEBUG и сотрудникам."""
+    if settings.DEBUG:
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_staff)
+
+
+async def ashows_server_timing(request):
+    if not settings.DEBUG and isinstance(
+        getattr(request, 'user', None), SimpleLazyObject
+    ):
+        # Пользователь сессии ещё не загружен, а это запрос к базе.
+        return await sync_to_async(shows_server_timing)(request)
+    return shows_server_timing(request)
+
+
+def finish(request, response, stats, server_timing):
+    duration = time.perf_counter() - stats.started
+    labels = {'view': get_view_name(request), 'method': request.method}
+    registry.observe('foodgram_view_duration_seconds', duration, **labels)
+    registry.observe('foodgram_view_db_queries', stats.queries, **labels)
+    registry.observe('foodgram_view_db_seconds', stats.db_time, **labels)
+    registry.observe(
+        'foodgram_view_serializer_seconds', stats.serializer_time, **labels
+    )
+    size = get_response_size(response)
+    registry.observe('foodgram_view_response_bytes', size, **labels)
+    if server_timing:
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={stats.db_time * 1000:.1f};'
+            f'desc="{stats.queries} queries"',
+            f'serializer;dur={stats.serializer_time * 1000:.1f}',
+            f'total;dur={duration * 1000:.1f}',
+        ))
+    threshold = settings.SLOW_REQUEST_THRESHOLD
+    if threshold and duration * 1000 >= threshold:
+        log_slow_request(request, labels['view'], duration, size, stats)
+    return response
+
+
+def log_slow_request(request, view, duration, size, stats):
+    fingerprints = Counter()
+    for sql, count in stats.statements.items():
+        fingerprints[fingerprint(sql)] += count
+    top = '\n'.join(
+        f'  {count} x {sql}'
+        for sql, count in fingerprints.most_common(
+            constants.SLOW_REQUEST_TOP_QUERIES
+        )
+    )
+    logger.warning(
+        'Медленный запрос %s %s (%s): %.1f мс, %d запросов к БД '
+        'за %.1f мс, сериализация %.1f мс, ответ %d байт\n%s',
+        request.method, request.get_full_path(), view, duration * 1000,
+        stats.queries, stats.db_time * 1000, stats.serializer_time * 1000,
+        size, top
+    )
+
+
+@sync_and_async_middleware
+def instrumentation_middleware(get_response):
+    """Собирает по каждому запросу число и время SQL-запросов, время
+    сериализации и размер ответа.
+
+    Данные попадают в метрики /metrics/, в журнал медленных запросов
+    (SLOW_REQUEST_THRESHOLD, мс) и, при DEBUG или для сотрудников,
+    в заголовок Server-Timing.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            if not settings.REQUEST_PROFILING:
+                return await get_response(request)
+            stats = RequestStats()
+            token = current_stats.set(stats)
+            try:
+                response = await get_response(request)
+            finally:
+                current_stats.reset(token)
+            # Вне статистики: проверка пользователя может обратиться к базе.
+            server_timing = await ashows_server_timing(request)
+            return finish(request, response, stats, server_timing)
+    else:
+        def middleware(request):
+            if not settings.REQUEST_PROFILING:
+                return get_response(request)
+            stats = RequestStats()
+            token = current_stats.set(stats)
+            try:
+                response = get_response(request)
+            finally:
+                current_stats.reset(token)
+            # Вне статистики: проверка пользователя может обратиться к базе.
+            server_timing = shows_server_timing(request)
+            return finish(request, response, stats, server_timing)
+    return middleware
@@ -0,0 +1,146 @@
+import json
+import platform
+import tempfile
+from datetime import datetime, timezone
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+
+from foodgram.benchmarks import (SCALES, SCENARIOS, generate_data,
+                                 run_benchmarks)
+from foodgram.images import pipeline
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark',
+    }
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеры горячих путей API на синтетических данных. Данные '
+        'создаются в отдельной тестовой базе, рабочая база не меняется.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale', choices=SCALES, default='small',
+            help='Размер синтетических данных'
+        )
+        for name in SCALES['small']:
+            parser.add_argument(
+                f'--{name.replace("_", "-")}', type=int, dest=name,
+                help='Переопределяет значение из --scale'
+            )
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Число замеров на сценарий'
+        )
+        parser.add_argument(
+            '--scenario', action='append', dest='scenarios',
+            choices=[scenario.name for scenario in SCENARIOS],
+            help='Запускать только указанные сценарии'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Зерно генератора данных'
+        )
+        parser.add_argument(
+            '--warm-cache', action='store_true',
+            help='Не сбрасывать кеш перед каждым запросом'
+        )
+        parser.add_argument(
+            '--output', help='Файл для результатов в JSON'
+        )
+        parser.add_argument(
+            '--baseline',
+            help='JSON прошлого запуска для сравнения медиан и запросов'
+        )
+        parser.add_argument(
+            '--fail-over-budget', action='store_true',
+            help='Завершаться с ошибкой при превышении бюджета запросов'
+        )
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat должен быть больше 0')
+        scale = {
+            name: options[name] if options[name] is not None else value
+            for name, value in SCALES[options['scale']].items()
+        }
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True
+        )
+        try:
+            # Кеш и медиафайлы тоже отдельные, чтобы не задеть рабочие.
+            with tempfile.TemporaryDirectory() as media_root, \
+                    override_settings(MEDIA_ROOT=media_root, CACHES=CACHES):
+                self.stderr.write('Генерация данных...')
+                data = generate_data(seed=options['seed'], **scale)
+                results = run_benchmarks(
+                    data, options['repeat'], options['scenarios'],
+                    options['warm_cache']
+                )
+                if pipeline.executor is not None:
+                    pipeline.executor.shutdown(wait=True)
+                    pipeline.executor = None
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'created': datetime.now(timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'scale': scale,
+            'seed': options['seed'],
+            'repeat': options['repeat'],
+            'warm_cache': options['warm_cache'],
+            'scenarios': results,
+        }
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(text + '\n')
+        else:
+            self.stdout.write(text)
+        if options['baseline']:
+            self.compare(results, options['baseline'])
+        over_budget = [
+            name for name, result in results.items()
+            if not result['within_budget']
+        ]
+        for name in over_budget:
+            self.stderr.write(self.style.WARNING(
+                f'{name}: {results[name]["queries"]} запросов при бюджете '
+                f'{results[name]["query_budget"]}'
+            ))
+        if over_budget and options['fail_over_budget']:
+            raise CommandError('Превышен бюджет SQL-запросов')
+
+    def compare(self, results, path):
+        try:
+            with open(path, encoding='utf-8') as file:
+                baseline = json.load(file)['scenarios']
+        except (OSError, ValueError, KeyError) as error:
+            raise CommandError(f'Не удалось прочитать {path}: {error}')
+        for name, result in results.items():
+            previous = baseline.get(name)
+            if previous is None:
+                continue
+            change = (
+                result['median_ms'] / previous['median_ms'] - 1
+                if previous['median_ms'] else 0
+            )
+            self.stderr.write(
+                f'{name}: медиана {previous["median_ms"]} -> '
+                f'{result["median_ms"]} мс ({change:+.0%}), запросов '
+                f'{previous["queries"]} -> {result["queries"]}'
+            )
@@ -1,32 +1,168 @@
+import csv
 import json
+from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
-from foodgram.models import Ingredient
+from foodgram import constants
+from foodgram.caching import RECIPES_VERSION_KEY, bump_version
+from foodgram.ingredient_search import catalog
+from foodgram.models import Ingredient, IngredientRecipe
+from foodgram.shopping_list import invalidate_recipe_shopping_lists
+
+
+def iter_json(file, chunk_size=constants.STREAM_CHUNK_SIZE):
+    """Построчно разбирает JSON-массив, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    opened = False
+    eof = False
+    while True:
+        buffer = buffer.lstrip()
+        if opened and buffer.startswith(','):
+            buffer = buffer[1:].lstrip()
+        if buffer:
+            if not opened:
+                if not buffer.startswith('['):
+                    raise CommandError('Файл должен содержать JSON-массив')
+                opened = True
+                buffer = buffer[1:]
+                continue
+            if buffer.startswith(']'):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise CommandError('Некорректный JSON')
+            else:
+                yield item
+                buffer = buffer[end:]
+                continue
+        if eof:
+            raise CommandError('Неожиданный конец JSON-файла')
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+
+
+def iter_csv(file):
+    """Читает строки вида «название,единица измерения»."""
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield {'name': row[0], 'measurement_unit': row[1]}
 
 
 class Command(BaseCommand):
-    help = 'Загрузка ингредиентов из JSON файла'
+    help = 'Загрузка ингредиентов из JSON или CSV файла'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=Path(settings.BASE_DIR) / 'foodgram' / 'ingredients.json',
+            type=Path,
+            help='Путь к файлу .json или .csv'
+        )
+        parser.add_argument(
+            '--batch-size',
+            default=constants.INGREDIENTS_BATCH_SIZE,
+            type=int,
+            help='Количество ингредиентов в одном INSERT'
+        )
+        parser.add_argument(
+            '--update',
+            action='store_true',
+            help='Обновлять единицу измерения у существующих ингредиентов'
+        )
 
     def handle(self, *args, **options):
-        with open(
-            'foodgram/ingredients.json',
-            'r',
-            encoding='utf-8'
-        ) as f:
-            ingredients = json.load(f)
-
-        created_count = 0
-        for item in ingredients:
-            _, created = Ingredient.objects.get_or_create(
-                name=item['name'],
-                measurement_unit=item['measurement_unit']
-            )
-            if created:
-                created_count += 1
+        path = options['path']
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть больше 0')
+        parsers = {'.json': iter_json, '.csv': iter_csv}
+        if path.suffix.lower() not in parsers:
+            raise CommandError('Поддерживаются только файлы .json и .csv')
+        if options['update']:
+            conflict_options = {
+                'update_conflicts': True,
+                'unique_fields': ['name'],
+                'update_fields': ['measurement_unit'],
+            }
+        else:
+            conflict_options = {'ignore_conflicts': True}
+
+        self.update = options['update']
+        self.processed = self.created = self.updated = 0
+        batch = {}
+        try:
+            with open(path, 'r', encoding='utf-8') as file, \
+                    transaction.atomic():
+                items = parsers[path.suffix.lower()](file)
+                for number, item in enumerate(items, 1):
+                    try:
+                        name = item['name'].strip()
+                        measurement_unit = item['measurement_unit'].strip()
+                    except (KeyError, TypeError, AttributeError):
+                        raise CommandError(
+                            f'Некорректный ингредиент №{number}: {item!r}'
+                        )
+                    if not name:
+                        continue
+                    # В одном INSERT ... ON CONFLICT имя не может
+                    # встречаться дважды.
+                    batch[name] = Ingredient(
+                        name=name, measurement_unit=measurement_unit
+                    )
+                    if len(batch) >= batch_size:
+                        self.save_batch(batch, conflict_options)
+                if batch:
+                    self.save_batch(batch, conflict_options)
+                # bulk_create не отправляет сигналы post_save: кеши
+                # сбрасываются здесь и в save_batch.
+                catalog.invalidate()
+                if self.updated:
+                    bump_version(RECIPES_VERSION_KEY)
+        except OSError as error:
+            raise CommandError(f'Не удалось прочитать файл: {error}')
 
         self.stdout.write(
             self.style.SUCCESS(
-                f'Успешно загружено {created_count} ингредиентов'
+                f'Обработано ингредиентов: {self.processed}, '
+                f'добавлено: {self.created}, обновлено: {self.updated}'
             )
         )
+
+    def save_batch(self, batch, conflict_options):
+        """Записывает только новые и, с --update, изменившиеся
+        ингредиенты: пропущенные не попадают в итоги."""
+        existing = {
+            name: (pk, measurement_unit)
+            for pk, name, measurement_unit in Ingredient.objects.filter(
+                name__in=batch
+            ).values_list('pk', 'name', 'measurement_unit')
+        }
+        new = [
+            ingredient for name, ingredient in batch.items()
+            if name not in existing
+        ]
+        changed = {
+            existing[name][0]: ingredient
+            for name, ingredient in batch.items()
+            if self.update and name in existing
+            and existing[name][1] != ingredient.measurement_unit
+        }
+        Ingredient.objects.bulk_create(
+            new + list(changed.values()), **conflict_options
+        )
+        if changed:
+            invalidate_recipe_shopping_lists(IngredientRecipe.objects.filter(
+                ingredient_id__in=changed
+            ).values_list('recipe_id', flat=True))
+        self.processed += len(batch)
+        self.created += len(new)
+        self.updated += len(changed)
+        batch.clear()
+        self.stdout.write(f'Обработано {self.processed} ингредиентов')
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from foodgram.models import FeedEntry
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересборка лент подписок в FeedEntry; нужна при переходе '
+        'на FEED_STRATEGY=write'
+    )
+
+    def handle(self, *args, **options):
+        created = FeedEntry.objects.rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(f'Записей в лентах: {created}')
+        )
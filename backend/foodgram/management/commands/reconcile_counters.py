@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from foodgram.models import (Favorite, IngredientRecipe, Recipe, ShoppingCart,
+                             User)
+
+
+def count_subquery(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            total=Count('pk')
+        ).values('total'),
+        output_field=IntegerField()
+    ), 0)
+
+
+COUNTERS = (
+    (Recipe, 'favorites_count', count_subquery(Favorite, 'recipe')),
+    (Recipe, 'shopping_cart_count', count_subquery(ShoppingCart, 'recipe')),
+    (
+        Recipe, 'ingredients_count',
+        count_subquery(IngredientRecipe, 'recipe')
+    ),
+    (User, 'recipes_count', count_subquery(Recipe, 'author')),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчёт счётчиков избранного, списков покупок, рецептов '
+        'и ингредиентов в составе'
+    )
+
+    def handle(self, *args, **options):
+        for model, field, actual in COUNTERS:
+            with transaction.atomic():
+                fixed = model.objects.exclude(
+                    **{field: actual}
+                ).update(**{field: actual})
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}.{field}: '
+                f'исправлено {fixed}'
+            )
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from foodgram.models import Recipe
+from foodgram.recipe_search import update_search_vectors
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт поисковых векторов рецептов'
+
+    def handle(self, *args, **options):
+        updated = update_search_vectors(Recipe.objects.all())
+        self.stdout.write(
+            self.style.SUCCESS(f'Обновлено рецептов: {updated}')
+        )
@@ -0,0 +1,93 @@
+from collections import defaultdict
+from threading import Lock
+
+
+class MetricsRegistry:
+    """Метрики процесса в текстовом формате Prometheus.
+
+    Значения хранятся в памяти воркера, поэтому при нескольких воркерах
+    каждый отдаёт свои счётчики, а суммирует их сервер метрик.
+    Для summary хранятся только _count и _sum, без квантилей.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.values = defaultdict(float)
+        self.descriptions = {}
+
+    def register(self, name, kind, description):
+        self.descriptions[name] = (kind, description)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] += value
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = value
+
+    def observe(self, name, value, **labels):
+        labels = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[(f'{name}_count', labels)] += 1
+            self.values[(f'{name}_sum', labels)] += value
+
+    @staticmethod
+    def format_labels(labels):
+        if not labels:
+            return ''
+        text = ','.join(
+            '{}="{}"'.format(
+                key, str(value).replace('\\', '\\\\').replace('"', '\\"')
+            )
+            for key, value in labels
+        )
+        return '{' + text + '}'
+
+    def render(self):
+        with self.lock:
+            values = sorted(self.values.items())
+        lines = []
+        for name, (kind, description) in sorted(self.descriptions.items()):
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            series = (
+                (f'{name}_count', f'{name}_sum') if kind == 'summary'
+                else (name,)
+            )
+            for (metric, labels), value in values:
+                if metric in series:
+                    lines.append(
+                        f'{metric}{self.format_labels(labels)} {value:g}'
+                    )
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+registry.register(
+    'foodgram_requests_total', 'counter', 'Обработанные HTTP-запросы'
+)
+registry.register(
+    'foodgram_db_connections_opened_total', 'counter',
+    'Новые соединения с базой данных'
+)
+registry.register(
+    'foodgram_view_duration_seconds', 'summary',
+    'Время обработки запроса представлением'
+)
+registry.register(
+    'foodgram_view_db_queries', 'summary', 'SQL-запросы на HTTP-запрос'
+)
+registry.register(
+    'foodgram_view_db_seconds', 'summary',
+    'Время SQL-запросов на HTTP-запрос'
+)
+registry.register(
+    'foodgram_view_serializer_seconds', 'summary',
+    'Время сериализации на HTTP-запрос'
+)
+registry.register(
+    'foodgram_view_response_bytes', 'summary', 'Размер ответа'
+)
@@ -0,0 +1,39 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+INDEXES = {
+    'foodgram_ingredient_name_upper_like': (
+        'CREATE INDEX foodgram_ingredient_name_upper_like '
+        'ON foodgram_ingredient (UPPER(name::text) text_pattern_ops)'
+    ),
+    'foodgram_ingredient_name_trgm': (
+        'CREATE INDEX foodgram_ingredient_name_trgm '
+        'ON foodgram_ingredient USING gin (name gin_trgm_ops)'
+    ),
+}
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in INDEXES.values():
+        schema_editor.execute(sql)
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram', '0001_initial'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.23 on 2026-10-18 04:18
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, F, Min
+
+RELATIONS = (
+    ('Favorite', 'recipe', 'favorites_count'),
+    ('ShoppingCart', 'recipe', 'shopping_cart_count'),
+    ('Subscription', 'author', None),
+)
+
+
+def remove_duplicates(apps, schema_editor):
+    """Оставляет по одной строке на пару и поправляет счётчики."""
+    Recipe = apps.get_model('foodgram', 'Recipe')
+    for model_name, target, counter in RELATIONS:
+        model = apps.get_model('foodgram', model_name)
+        duplicates = model.objects.values('user', target).annotate(
+            first_id=Min('id'), total=Count('id')
+        ).filter(total__gt=1)
+        for row in duplicates:
+            model.objects.filter(
+                user=row['user'], **{target: row[target]}
+            ).exclude(id=row['first_id']).delete()
+            if counter:
+                Recipe.objects.filter(pk=row[target]).update(
+                    **{counter: F(counter) - (row['total'] - 1)}
+                )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram', '0004_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favorite'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_shopping_cart'),
+        ),
+        migrations.AddConstraint(
+            model_name='subscription',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_subscription'),
+        ),
+        # Уникальный индекс начинается с user_id и заменяет отдельный
+        # индекс внешнего ключа.
+        migrations.AlterField(
+            model_name='favorite',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='favorites', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='shoppingcart',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='shopping_carts', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='subscription',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='follower', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
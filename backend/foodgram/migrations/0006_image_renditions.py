@@ -0,0 +1,29 @@
+# Generated by Django 4.2.23 on 2026-10-18 04:23
+
+from django.db import migrations, models
+import foodgram.storages
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram', '0005_unique_user_relations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='thumbnail',
+            field=models.ImageField(blank=True, default=None, editable=False, null=True, storage=foodgram.storages.ContentHashStorage(), upload_to='foodgram/images/', verbose_name='Миниатюра'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(blank=True, default=None, null=True, storage=foodgram.storages.ContentHashStorage(), upload_to='foodgram/images/', verbose_name='Загрузить фото'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='avatar',
+            field=models.ImageField(blank=True, null=True, storage=foodgram.storages.ContentHashStorage(), upload_to='users/avatars/', verbose_name='Аватар'),
+        ),
+    ]
@@ -0,0 +1,94 @@
+# Generated by Django 4.2.23 on 2026-10-18 04:44
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import (Case, OuterRef, Subquery, TextField, Value,
+                              When)
+from django.db.models.functions import Coalesce
+
+INDEX_NAME = 'recipe_search_vector_idx'
+BATCH_SIZE = 1000
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX {INDEX_NAME} '
+        'ON foodgram_recipe USING gin (search_vector)'
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+def fill_search_vectors(apps, schema_editor):
+    """Заполнение на момент миграции; код приложения не используется,
+    чтобы его изменения не меняли эту миграцию."""
+    alias = schema_editor.connection.alias
+    Recipe = apps.get_model('foodgram', 'Recipe')
+    IngredientRecipe = apps.get_model('foodgram', 'IngredientRecipe')
+    recipes = Recipe.objects.using(alias)
+    ingredient_recipes = IngredientRecipe.objects.using(alias)
+    if schema_editor.connection.vendor == 'postgresql':
+        config = settings.RECIPE_SEARCH_CONFIG
+        ingredient_names = ingredient_recipes.filter(
+            recipe=OuterRef('pk')
+        ).values('recipe').annotate(
+            names=StringAgg('ingredient__name', ' ')
+        ).values('names')
+        recipes.update(search_vector=(
+            SearchVector('name', weight='A', config=config)
+            + SearchVector(
+                Coalesce(
+                    Subquery(ingredient_names), Value(''),
+                    output_field=TextField()
+                ),
+                weight='B', config=config
+            )
+            + SearchVector('text', weight='C', config=config)
+        ))
+        return
+    documents = {
+        pk: [name, text]
+        for pk, name, text in recipes.values_list('pk', 'name', 'text')
+    }
+    for recipe_id, name in ingredient_recipes.values_list(
+        'recipe_id', 'ingredient__name'
+    ):
+        documents[recipe_id].insert(-1, name)
+    documents = [
+        (pk, '\n'.join(parts).casefold()) for pk, parts in documents.items()
+    ]
+    for start in range(0, len(documents), BATCH_SIZE):
+        batch = documents[start:start + BATCH_SIZE]
+        recipes.filter(pk__in=[pk for pk, _ in batch]).update(
+            search_vector=Case(
+                *(When(pk=pk, then=Value(document))
+                  for pk, document in batch),
+                output_field=TextField()
+            )
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram', '0007_recipe_tag_through'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -1,16 +1,50 @@
 import secrets
+from contextlib import contextmanager
+from contextvars import ContextVar
 
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import (MinValueValidator, RegexValidator,
                                     validate_email)
-from django.db import models
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import Exists, F, OuterRef, Prefetch
+from django.db.models.functions import Greatest
+from django.dispatch import Signal
 
 from foodgram import constants
+from foodgram.storages import ContentHashStorage
 from foodgram.validators import validate_username
 
 
-class User(AbstractUser):
+def update_counter(queryset, field, delta):
+    """Атомарно меняет счётчик в базе, не опуская его ниже нуля."""
+    return queryset.update(**{field: Greatest(F(field) + delta, 0)})
+
+
+class CounterFieldsMixin:
+    """Не перезаписывает счётчики при обычном сохранении объекта.
+
+    Счётчики меняются только атомарными UPDATE с F(), поэтому значения,
+    загруженные в память вместе с объектом, могут быть устаревшими.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (
+            not self._state.adding
+            and kwargs.get('update_fields') is None
+            and not kwargs.get('force_insert')
+        ):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class User(CounterFieldsMixin, AbstractUser):
     username = models.CharField(
         max_length=constants.MAX_LENGHT_NAME,
         unique=True,
@@ -30,11 +64,18 @@ class User(AbstractUser):
     last_name = models.CharField(max_length=constants.MAX_LENGHT_NAME)
     avatar = models.ImageField(
         upload_to='users/avatars/',
+        storage=ContentHashStorage(),
         null=True,
         blank=True,
         verbose_name='Аватар'
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество рецептов'
+    )
 
+    counter_fields = ('recipes_count',)
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name', ]
 
@@ -90,7 +131,39 @@ class Tag(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    def with_related(self):
+        """Подгружает автора, теги и ингредиенты фиксированным числом
+        запросов вместо отдельного запроса на каждый рецепт.
+
+        Для тегов загружаются только id: сами теги берутся из справочника
+        в памяти (foodgram.tag_catalog)."""
+        return self.select_related('author').prefetch_related(
+            'recipetag_set',
+            Prefetch(
+                'recipe_ingredients',
+                queryset=IngredientRecipe.objects.select_related(
+                    'ingredient'
+                )
+            )
+        )
+
+    def with_user_flags(self, user):
+        """Аннотирует флаги is_favorited и is_in_shopping_cart
+        для текущего пользователя."""
+        if not user.is_authenticated:
+            return self
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            ))
+        )
+
+
+class Recipe(CounterFieldsMixin, models.Model):
     name = models.CharField(
         max_length=constants.MAX_LENGHT_NAME,
         verbose_name='Название рецепта'
@@ -100,25 +173,38 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         upload_to='foodgram/images/',
+        storage=ContentHashStorage(),
         blank=True,
         null=True,
         default=None,
         verbose_name='Загрузить фото'
     )
+    thumbnail = models.ImageField(
+        upload_to='foodgram/images/',
+        storage=ContentHashStorage(),
+        blank=True,
+        null=True,
+        default=None,
+        editable=False,
+        verbose_name='Миниатюра'
+    )
     ingredients = models.ManyToManyField(
         'Ingredient',
         through='IngredientRecipe',
         related_name='recipes',
         verbose_name='Ингредиент'
     )
+    # Рецепты автора читаются по индексу (author, -pub_date, -id).
     author = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         related_name='recipes',
         on_delete=models.CASCADE,
+        db_index=False,
         verbose_name='Автор'
     )
     tags = models.ManyToManyField(
         Tag,
+        through='RecipeTag',
         verbose_name='Теги',
         related_name='recipes'
     )
@@ -136,32 +222,85 @@ class Recipe(models.Model):
     pub_date = models.DateTimeField(
         verbose_name='Дата публикации',
         auto_now_add=True)
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Добавлений в избранное'
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Добавлений в список покупок'
+    )
+    # Знаменатель покрытия в foodgram.ingredient_match без чтения всего
+    # состава рецепта. Отдельные строки состава учитывают сигналы,
+    # массовую запись состава — сериализатор.
+    ingredients_count = models.PositiveSmallIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Ингредиентов в составе'
+    )
+    # Заполняется foodgram.recipe_search после фиксации транзакции.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = RecipeQuerySet.as_manager()
+    # search_vector, как и счётчики, меняется только отдельным UPDATE.
+    counter_fields = (
+        'favorites_count', 'shopping_cart_count', 'ingredients_count',
+        'search_vector'
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
-        ordering = ['-pub_date']
+        ordering = ['-pub_date', '-id']
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['-favorites_count', '-id'],
+                name='recipe_favorites_count_idx'
+            ),
+            # Лента подписок при FEED_STRATEGY=read: страница рецептов
+            # каждого автора уже упорядочена в индексе.
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
-    def _generate_short_code(self):
-        code = secrets.token_urlsafe(
+    @staticmethod
+    def _generate_short_code():
+        return secrets.token_urlsafe(
             constants.SHORT_URL_LEN
         )[:constants.SHORT_URL_LEN]
-        while Recipe.objects.filter(short_url=code).exists():
-            code = secrets.token_urlsafe(
-                constants.SHORT_URL_LEN
-            )[:constants.SHORT_URL_LEN]
-        return code
 
     def get_short_url(self, request):
         return request.build_absolute_uri(f'/s/{self.short_url}/')
 
     def save(self, *args, **kwargs):
-        if not self.short_url:
+        """Код короткой ссылки проверяется уникальным индексом: при
+        совпадении вставка повторяется с новым кодом в точке сохранения."""
+        if self.short_url:
+            return super().save(*args, **kwargs)
+        for attempt in range(constants.SHORT_URL_ATTEMPTS):
             self.short_url = self._generate_short_code()
-        super().save(*args, **kwargs)
+            try:
+                with transaction.atomic(using=kwargs.get('using')):
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                if (
+                    attempt == constants.SHORT_URL_ATTEMPTS - 1
+                    or not Recipe.objects.filter(
+                        short_url=self.short_url
+                    ).exists()
+                ):
+                    raise
 
 
 class IngredientRecipe(models.Model):
@@ -194,11 +333,144 @@ class IngredientRecipe(models.Model):
         return f'{self.ingredient} {self.amount}'
 
 
+class RecipeTag(models.Model):
+    """Связь рецепта с тегом.
+
+    Уникальный индекс (recipe, tag) отдаёт теги рецепта, а индекс
+    (tag, recipe) — рецепты тега для фильтра по тегам, поэтому
+    отдельные индексы внешних ключей не нужны.
+    """
+    # Таблица создана автоматически для ManyToManyField, id в ней
+    # bigint по DEFAULT_AUTO_FIELD.
+    id = models.BigAutoField(primary_key=True)
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        db_index=False
+    )
+    tag = models.ForeignKey(
+        Tag,
+        on_delete=models.CASCADE,
+        db_index=False
+    )
+
+    class Meta:
+        db_table = 'foodgram_recipe_tags'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'tag'],
+                name='unique_recipe_tag'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['tag', 'recipe'],
+                name='recipe_tag_tag_recipe_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} {self.tag}'
+
+
+# Отправляется после массового изменения связей пользователя:
+# sender — модель связи, object_ids — затронутые рецепты или авторы,
+# delta — +1 при добавлении и -1 при удалении.
+relations_changed = Signal()
+
+# Истина внутри bulk_composition_write(): приёмники post_save и
+# post_delete строк состава пропускают их.
+composition_bulk_write = ContextVar('composition_bulk_write', default=False)
+
+
+@contextmanager
+def bulk_composition_write():
+    """Запись состава рецепта пачкой без обработки каждой строки.
+
+    Счётчик ingredients_count, поисковый вектор и кеши рецепта
+    обновляет вызывающий код.
+    """
+    token = composition_bulk_write.set(True)
+    try:
+        yield
+    finally:
+        composition_bulk_write.reset(token)
+
+
+class UserRelationQuerySet(models.QuerySet):
+    """Добавление и удаление связей пользователя одним запросом.
+
+    Повторы отсекает уникальный индекс, а RETURNING сообщает, какие строки
+    действительно изменились, поэтому одновременные запросы не создают
+    дублей. По сигналу relations_changed обновляются счётчики и кеши.
+    """
+
+    def _columns(self):
+        quote = connections[self.db].ops.quote_name
+        meta = self.model._meta
+        return (
+            quote(meta.db_table),
+            quote(meta.get_field('user').column),
+            quote(meta.get_field(self.model.relation_field).column),
+        )
+
+    def _execute(self, user, sql, params, delta):
+        with transaction.atomic(using=self.db):
+            with connections[self.db].cursor() as cursor:
+                cursor.execute(sql, params)
+                object_ids = [row[0] for row in cursor.fetchall()]
+            if object_ids:
+                relations_changed.send(
+                    sender=self.model, user_id=user.pk,
+                    object_ids=object_ids, delta=delta, using=self.db
+                )
+        return object_ids
+
+    def add_many(self, user, object_ids):
+        """INSERT ... ON CONFLICT DO NOTHING; возвращает добавленные id."""
+        object_ids = list(dict.fromkeys(object_ids))
+        if not object_ids:
+            return []
+        table, user_column, object_column = self._columns()
+        values = ', '.join(['(%s, %s)'] * len(object_ids))
+        sql = (
+            f'INSERT INTO {table} ({user_column}, {object_column}) '
+            f'VALUES {values} ON CONFLICT DO NOTHING '
+            f'RETURNING {object_column}'
+        )
+        params = [
+            value for object_id in object_ids for value in (user.pk, object_id)
+        ]
+        return self._execute(user, sql, params, 1)
+
+    def remove_many(self, user, object_ids=None):
+        """DELETE ... RETURNING; без object_ids удаляет все связи."""
+        table, user_column, object_column = self._columns()
+        sql = f'DELETE FROM {table} WHERE {user_column} = %s'
+        params = [user.pk]
+        if object_ids is not None:
+            object_ids = list(dict.fromkeys(object_ids))
+            if not object_ids:
+                return []
+            placeholders = ', '.join(['%s'] * len(object_ids))
+            sql += f' AND {object_column} IN ({placeholders})'
+            params += object_ids
+        sql += f' RETURNING {object_column}'
+        return self._execute(user, sql, params, -1)
+
+    def add(self, user, obj):
+        return bool(self.add_many(user, [obj.pk]))
+
+    def remove(self, user, obj):
+        return bool(self.remove_many(user, [obj.pk]))
+
+
 class Favorite(models.Model):
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
-        related_name='favorites'
+        related_name='favorites',
+        db_index=False
     )
     recipe = models.ForeignKey(
         Recipe,
@@ -206,12 +478,23 @@ class Favorite(models.Model):
         related_name='favorited_by'
     )
 
+    objects = UserRelationQuerySet.as_manager()
+    relation_field = 'recipe'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_favorite'
+            )]
+
 
 class ShoppingCart(models.Model):
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
-        related_name='shopping_carts'
+        related_name='shopping_carts',
+        db_index=False
     )
     recipe = models.ForeignKey(
         Recipe,
@@ -219,15 +502,125 @@ class ShoppingCart(models.Model):
         related_name='in_shopping_carts'
     )
 
+    objects = UserRelationQuerySet.as_manager()
+    relation_field = 'recipe'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_shopping_cart'
+            )]
+
 
 class Subscription(models.Model):
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
-        related_name='follower'
+        related_name='follower',
+        db_index=False
     )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name='following'
     )
+
+    objects = UserRelationQuerySet.as_manager()
+    relation_field = 'author'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'],
+                name='unique_subscription'
+            )]
+
+
+class FeedEntryQuerySet(models.QuerySet):
+    """Заполнение ленты подписок одним INSERT ... SELECT.
+
+    Строки собираются соединением подписок с рецептами внутри базы без
+    чтения в Python, повторы отсекает уникальный индекс (user, recipe).
+    """
+
+    def _fill(self, condition, params=()):
+        quote = connections[self.db].ops.quote_name
+        # WHERE обязателен: без него SQLite не разбирает ON CONFLICT
+        # после SELECT.
+        sql = (
+            f'INSERT INTO {quote(self.model._meta.db_table)} '
+            f'(user_id, recipe_id, pub_date) '
+            f'SELECT subscription.user_id, recipe.id, recipe.pub_date '
+            f'FROM {quote(Subscription._meta.db_table)} subscription '
+            f'INNER JOIN {quote(Recipe._meta.db_table)} recipe '
+            f'ON recipe.author_id = subscription.author_id '
+            f'WHERE {condition} ON CONFLICT DO NOTHING'
+        )
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.rowcount
+
+    def fan_out(self, recipe_id):
+        """Добавляет новый рецепт в ленты всех подписчиков автора."""
+        return self._fill('recipe.id = %s', [recipe_id])
+
+    def backfill(self, user_id, author_ids):
+        """Добавляет в ленту рецепты авторов, на которых подписались."""
+        author_ids = list(author_ids)
+        if not author_ids:
+            return 0
+        placeholders = ', '.join(['%s'] * len(author_ids))
+        return self._fill(
+            f'subscription.user_id = %s '
+            f'AND subscription.author_id IN ({placeholders})',
+            [user_id, *author_ids]
+        )
+
+    def remove_authors(self, user_id, author_ids):
+        """Убирает из ленты рецепты авторов, от которых отписались."""
+        return self.filter(
+            user_id=user_id, recipe__author_id__in=list(author_ids)
+        ).delete()[0]
+
+    def rebuild(self):
+        """Собирает ленты всех пользователей заново по подпискам."""
+        with transaction.atomic(using=self.db):
+            self.all().delete()
+            return self._fill('TRUE')
+
+
+class FeedEntry(models.Model):
+    """Рецепт в ленте подписчика при FEED_STRATEGY=write.
+
+    Дата публикации скопирована из рецепта, поэтому страница ленты
+    читается одним проходом по индексу (user, -pub_date, -recipe).
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        db_index=False
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries'
+    )
+    pub_date = models.DateTimeField()
+
+    objects = FeedEntryQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_entry_user_pub_date_idx'
+            ),
+        ]
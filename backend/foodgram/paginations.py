@@ -1,6 +1,213 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from datetime import datetime
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import (EmptyResultSet, FieldDoesNotExist,
+                                    ValidationError)
+from django.core.paginator import Paginator
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+from rest_framework import exceptions
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from foodgram import constants
+
+
+class CachedCountPaginator(Paginator):
+    """Кеширует COUNT(*) по тексту запроса на короткое время."""
+
+    @cached_property
+    def count(self):
+        timeout = settings.PAGINATION_COUNT_CACHE_TIMEOUT
+        if not timeout or not isinstance(self.object_list, QuerySet):
+            return super().count
+        try:
+            sql = str(self.object_list.query)
+        except EmptyResultSet:
+            return 0
+        key = f'pagination_count:{md5(sql.encode()).hexdigest()}'
+        count = cache.get(key)
+        if count is None:
+            count = super().count
+            cache.set(key, count, timeout)
+        return count
 
 
 class FoodgramPagination(PageNumberPagination):
     page_size_query_param = "limit"
     page_size = 6
+    max_page_size = constants.MAX_PAGE_SIZE
+    django_paginator_class = CachedCountPaginator
+
+
+class KeysetPagination(BasePagination):
+    """Пагинация по ключу сортировки без OFFSET и COUNT(*).
+
+    Курсор хранит значения полей сортировки последнего элемента
+    страницы, следующая страница выбирается условием
+    (a < x) OR (a = x AND b < y) по составному индексу. Сортировка
+    берётся из запроса (?ordering=), без неё — ordering.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    page_size = 6
+    max_page_size = constants.MAX_PAGE_SIZE
+    ordering = ('-pub_date', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.model = queryset.model
+        self.ordering = self.get_ordering(queryset)
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.get_keyset_filter(position))
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, queryset):
+        """Курсор строится только по обязательным полям модели:
+        сортировку по релевантности поиска им не продолжить."""
+        ordering = list(queryset.query.order_by)
+        if not ordering:
+            return self.ordering
+        for name in ordering:
+            if not (
+                isinstance(name, str) and self.is_keyset_field(
+                    name.lstrip('-')
+                )
+            ):
+                raise exceptions.ValidationError({
+                    self.cursor_query_param:
+                    'Курсор нельзя сочетать с этой сортировкой.'
+                })
+        if ordering[-1].lstrip('-') != 'id':
+            ordering.append('-id')
+        return tuple(ordering)
+
+    def is_keyset_field(self, name):
+        try:
+            return not self.get_model_field(name).null
+        except FieldDoesNotExist:
+            return False
+
+    def get_fields(self):
+        return [
+            (name.lstrip('-'), name.startswith('-')) for name in self.ordering
+        ]
+
+    def get_model_field(self, name):
+        return self.model._meta.get_field(name)
+
+    def get_keyset_filter(self, position):
+        fields = self.get_fields()
+        keyset_filter = Q()
+        equal = {}
+        for (name, descending), value in zip(fields, position):
+            lookup = f'{name}__lt' if descending else f'{name}__gt'
+            keyset_filter |= Q(**equal, **{lookup: value})
+            equal[name] = value
+        # Граница по первому полю позволяет читать индекс диапазоном.
+        name, descending = fields[0]
+        lookup = f'{name}__lte' if descending else f'{name}__gte'
+        return Q(**{lookup: position[0]}) & keyset_filter
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            fields = self.get_fields()
+            if len(values) != len(fields):
+                raise ValueError
+            return [
+                self.get_model_field(name).to_python(value)
+                for (name, _), value in zip(fields, values)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound('Некорректный курсор.')
+
+    def encode_cursor(self, instance):
+        values = []
+        for name, _ in self.get_fields():
+            value = getattr(instance, name)
+            # isoformat() сохраняет микросекунды, которые теряет
+            # DjangoJSONEncoder.
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            values.append(value)
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.page[-1])
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+
+class SubscriptionKeysetPagination(KeysetPagination):
+    """У авторов нет даты публикации, ключом служит их id."""
+    ordering = ('id',)
+
+
+class FeedKeysetPagination(KeysetPagination):
+    """Лента при FEED_STRATEGY=write упорядочена по дате из FeedEntry.
+
+    feed_pub_date — аннотация foodgram.feed, равная дате рецепта.
+    """
+    ordering = ('-feed_pub_date', '-id')
+
+    def get_model_field(self, name):
+        if name == 'feed_pub_date':
+            return self.model._meta.get_field('pub_date')
+        return super().get_model_field(name)
+
+
+class KeysetPaginationMixin:
+    """Включает KeysetPagination, если в запросе передан ?cursor=.
+
+    Первая страница запрашивается с пустым курсором, следующие — по
+    ссылке next. Без параметра работает обычная постраничная пагинация.
+    """
+    keyset_pagination_class = None
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            pagination_class = self.pagination_class
+            if (
+                self.keyset_pagination_class is not None
+                and KeysetPagination.cursor_query_param
+                in self.request.query_params
+            ):
+                pagination_class = self.keyset_pagination_class
+            self._paginator = pagination_class() if pagination_class else None
+        return self._paginator
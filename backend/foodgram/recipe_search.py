@@ -0,0 +1,146 @@
+"""Полнотекстовый поиск рецептов по названию, описанию и ингредиентам.
+
+В PostgreSQL поле Recipe.search_vector хранит tsvector с весами
+(название — A, ингредиенты — B, описание — C) и покрыто GIN-индексом,
+а выдача ранжируется SearchRank. В остальных СУБД в том же поле хранится
+текст в нижнем регистре, и поиск сводится к вхождению всех слов.
+"""
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connections, transaction
+from django.db.models import (Case, F, OuterRef, Subquery, TextField, Value,
+                              When)
+from django.db.models.functions import Coalesce, StrIndex
+
+from foodgram import constants
+
+UPDATE_BATCH_SIZE = 1000
+
+
+def use_full_text_search(using='default'):
+    return connections[using].vendor == 'postgresql'
+
+
+def build_search_vector(ingredient_recipe_model):
+    config = settings.RECIPE_SEARCH_CONFIG
+    ingredient_names = ingredient_recipe_model.objects.filter(
+        recipe=OuterRef('pk')
+    ).values('recipe').annotate(
+        names=StringAgg('ingredient__name', ' ')
+    ).values('names')
+    return (
+        SearchVector('name', weight='A', config=config)
+        + SearchVector(
+            Coalesce(
+                Subquery(ingredient_names), Value(''),
+                output_field=TextField()
+            ),
+            weight='B', config=config
+        )
+        + SearchVector('text', weight='C', config=config)
+    )
+
+
+def build_documents(queryset, ingredient_recipe_model):
+    documents = {
+        pk: [name, text]
+        for pk, name, text in queryset.values_list('pk', 'name', 'text')
+    }
+    ingredient_names = ingredient_recipe_model.objects.filter(
+        recipe__in=queryset.values('pk')
+    ).values_list('recipe_id', 'ingredient__name')
+    for recipe_id, name in ingredient_names:
+        if recipe_id in documents:
+            # Ингредиенты между названием и описанием: при ранжировании
+            # по позиции вхождения они весят больше описания.
+            documents[recipe_id].insert(-1, name)
+    return {
+        pk: '\n'.join(parts).casefold() for pk, parts in documents.items()
+    }
+
+
+def update_search_vectors(queryset):
+    """Пересчитывает поисковые данные рецептов из queryset.
+
+    Принимает и исторические модели, поэтому используется в миграции.
+    """
+    model = queryset.model
+    ingredient_recipe_model = model._meta.get_field(
+        'recipe_ingredients'
+    ).related_model
+    if use_full_text_search(queryset.db):
+        return queryset.update(
+            search_vector=build_search_vector(ingredient_recipe_model)
+        )
+    documents = list(
+        build_documents(queryset, ingredient_recipe_model).items()
+    )
+    for start in range(0, len(documents), UPDATE_BATCH_SIZE):
+        batch = documents[start:start + UPDATE_BATCH_SIZE]
+        model.objects.using(queryset.db).filter(
+            pk__in=[pk for pk, _ in batch]
+        ).update(search_vector=Case(
+            *(When(pk=pk, then=Value(document)) for pk, document in batch),
+            output_field=TextField()
+        ))
+    return len(documents)
+
+
+def schedule_search_update(queryset):
+    """Пересчёт после фиксации транзакции, когда состав рецепта
+    уже записан."""
+    transaction.on_commit(
+        lambda: update_search_vectors(queryset), using=queryset.db
+    )
+
+
+def schedule_recipe_search_update(queryset, pk):
+    """Пересчёт одного рецепта после фиксации транзакции.
+
+    Рецепты копятся в наборе соединения: сколько бы строк состава
+    ни поменялось в транзакции, рецепт пересчитывается один раз.
+    """
+    pending = connections[queryset.db].__dict__.setdefault(
+        'pending_search_updates', set()
+    )
+    pending.add(pk)
+
+    def flush():
+        # Первый вызов забирает весь набор, остальные ничего не делают.
+        # После отката в наборе могут остаться лишние рецепты: их
+        # повторный пересчёт безвреден.
+        if pending:
+            pks = set(pending)
+            pending.clear()
+            update_search_vectors(queryset.filter(pk__in=pks))
+
+    transaction.on_commit(flush, using=queryset.db)
+
+
+def search_recipes(queryset, query):
+    """Рецепты, подходящие под запрос, от самых релевантных."""
+    query = query.strip()[:constants.RECIPE_SEARCH_MAX_LENGTH]
+    if not query:
+        return queryset
+    if use_full_text_search(queryset.db):
+        search_query = SearchQuery(
+            query,
+            config=settings.RECIPE_SEARCH_CONFIG,
+            search_type='websearch'
+        )
+        return queryset.filter(search_vector=search_query).annotate(
+            search_rank=SearchRank(F('search_vector'), search_query)
+        ).order_by('-search_rank', '-pub_date', '-id')
+    words = query.casefold().split()
+    for word in words:
+        queryset = queryset.filter(search_vector__contains=word)
+    # Чем раньше слова встречаются в документе, тем выше рецепт:
+    # сначала идут совпадения в названии, затем в ингредиентах.
+    position = sum(
+        (StrIndex('search_vector', Value(word)) for word in words), Value(0)
+    )
+    return queryset.annotate(search_rank=position).order_by(
+        'search_rank', '-pub_date', '-id'
+    )
@@ -1,17 +1,36 @@
+from collections import Counter
+
 from django.contrib.auth.password_validation import validate_password
 from django.db import transaction
 from djoser.serializers import TokenCreateSerializer
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import exceptions, serializers
 from rest_framework.authtoken.models import Token
 from rest_framework.validators import UniqueTogetherValidator, UniqueValidator
 
 from foodgram import constants
-from foodgram.models import Ingredient, IngredientRecipe, Recipe, Tag, User
+from foodgram.images import HashedBase64ImageField
+from foodgram.instrumentation import ProfiledSerializerMixin
+from foodgram.models import (Ingredient, IngredientRecipe, Recipe, Tag, User,
+                             bulk_composition_write)
+from foodgram.shopping_list import invalidate_recipe_shopping_lists
+from foodgram.tag_catalog import catalog as tag_catalog
+
+
+def get_subscribed_ids(request):
+    """Возвращает id авторов, на которых подписан текущий пользователь.
+
+    Множество загружается одним запросом и кешируется на объекте запроса,
+    поэтому все проверки is_subscribed в рамках запроса идут из памяти.
+    """
+    if not hasattr(request, '_subscribed_ids'):
+        request._subscribed_ids = set(
+            request.user.follower.values_list('author_id', flat=True)
+        )
+    return request._subscribed_ids
 
 
 class AvatarSerializer(serializers.ModelSerializer):
-    avatar = Base64ImageField(required=True, allow_null=True)
+    avatar = HashedBase64ImageField(required=True, allow_null=True)
 
     class Meta:
         model = User
@@ -32,7 +51,7 @@ class EmailAuthTokenSerializer(TokenCreateSerializer):
             )
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     username = serializers.CharField(
         max_length=constants.MAX_LENGHT_NAME,
         validators=[
@@ -54,7 +73,7 @@ class UserSerializer(serializers.ModelSerializer):
         write_only=True,
         validators=[validate_password],
     )
-    avatar = Base64ImageField(required=False, allow_null=False)
+    avatar = HashedBase64ImageField(required=False, allow_null=False)
 
     class Meta:
         model = User
@@ -110,17 +129,21 @@ class UserSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         if not request or not request.user.is_authenticated:
             return False
-        return request.user.follower.filter(author=obj).exists()
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return obj.id in get_subscribed_ids(request)
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Tag
         fields = ('id', 'name', 'slug')
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(
+    ProfiledSerializerMixin, serializers.ModelSerializer
+):
     class Meta:
         model = Ingredient
         fields = ('id', 'name', 'measurement_unit')
@@ -139,27 +162,52 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class RecipeSerializer(serializers.ModelSerializer):
-    tags = TagSerializer(many=True, read_only=True)
+def get_tag_index(context):
+    """Справочник тегов один на весь ответ, а не на каждый рецепт."""
+    if 'tag_index' not in context:
+        context['tag_index'] = tag_catalog.get_index()
+    return context['tag_index']
+
+
+class RecipeSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
+    tags = serializers.SerializerMethodField()
     author = UserSerializer(read_only=True)
     ingredients = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
-    image = Base64ImageField(required=True, allow_null=False)
+    image = HashedBase64ImageField(required=True, allow_null=False)
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients',
             'is_favorited', 'is_in_shopping_cart',
-            'name', 'image', 'text', 'cooking_time'
+            'name', 'image', 'text', 'cooking_time',
+            'thumbnail', 'favorites_count', 'shopping_cart_count'
         )
+        read_only_fields = (
+            'thumbnail', 'favorites_count', 'shopping_cart_count'
+        )
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # В списках (context['list_thumbnails']) карточкам хватает
+        # уменьшенной копии; пока её нет, отдаётся оригинал.
+        if self.context.get('list_thumbnails') and data['thumbnail']:
+            data['image'] = data['thumbnail']
+        return data
 
     def validate(self, data):
         data = super().validate(data)
         data = self.validate_image(data)
-        data = self.validate_ingredients(data)
-        data = self.validate_tags(data)
+        errors = {}
+        for validator in (self.validate_ingredients, self.validate_tags):
+            try:
+                data = validator(data)
+            except serializers.ValidationError as error:
+                errors.update(error.detail)
+        if errors:
+            raise serializers.ValidationError(errors)
         return data
 
     def validate_image(self, data):
@@ -170,80 +218,111 @@ class RecipeSerializer(serializers.ModelSerializer):
             )
         return data
 
+    @staticmethod
+    def _find_duplicates(ids):
+        return [key for key, count in Counter(ids).items() if count > 1]
+
     def validate_ingredients(self, data):
+        """Проверяет все ингредиенты одним запросом к базе."""
         ingredients = self.initial_data.get('ingredients')
         if not ingredients:
             raise serializers.ValidationError(
                 {'ingredients': ['Нужно выбрать ингредиент!']},
                 code='required'
             )
-        ingredients_list = []
-        for item in ingredients:
-            try:
-                ingredient = Ingredient.objects.get(id=item['id'])
-            except Ingredient.DoesNotExist:
-                raise serializers.ValidationError(
-                    {'ingredients': [f'Ингредиент {item["id"]} не найден!']},
-                    code='invalid'
-                )
-            if ingredient in ingredients_list:
-                raise serializers.ValidationError(
-                    {'ingredients': ['Ингредиенты не должны повторяться!']},
-                    code='duplicate'
-                )
-            if int(item['amount']) <= 0:
-                raise serializers.ValidationError(
-                    {'amount': ['Количество должно быть больше 0!']},
-                    code='invalid'
-                )
-            ingredients_list.append(ingredient)
-        data['ingredients'] = ingredients
+        try:
+            items = [
+                (int(item['id']), int(item['amount'])) for item in ingredients
+            ]
+        except (KeyError, TypeError, ValueError):
+            raise serializers.ValidationError(
+                {'ingredients': ['Укажите id и количество ингредиента!']},
+                code='invalid'
+            )
+        ids = [ingredient_id for ingredient_id, _ in items]
+        found = Ingredient.objects.in_bulk(ids)
+        errors = {}
+        missing = [
+            ingredient_id for ingredient_id in dict.fromkeys(ids)
+            if ingredient_id not in found
+        ]
+        if missing:
+            errors['ingredients'] = [
+                f'Ингредиент {ingredient_id} не найден!'
+                for ingredient_id in missing
+            ]
+        if self._find_duplicates(ids):
+            errors.setdefault('ingredients', []).append(
+                'Ингредиенты не должны повторяться!'
+            )
+        if any(amount <= 0 for _, amount in items):
+            errors['amount'] = ['Количество должно быть больше 0!']
+        if errors:
+            raise serializers.ValidationError(errors, code='invalid')
+        data['ingredients'] = [
+            {'ingredient': found[ingredient_id], 'amount': amount}
+            for ingredient_id, amount in items
+        ]
         return data
 
     def validate_tags(self, data):
+        """Проверяет все теги одним запросом к базе.
+
+        Не по справочнику в памяти: снимок воркера может отставать, и
+        удалённый тег упал бы на внешнем ключе при записи.
+        """
         tags = self.initial_data.get('tags')
         if not tags:
             raise serializers.ValidationError(
                 {'tags': ['Нужно выбрать тег!']},
                 code='required'
             )
-        tags_list = []
-        for tag_id in tags:
-            try:
-                tag = Tag.objects.get(id=tag_id)
-            except Tag.DoesNotExist:
-                raise serializers.ValidationError(
-                    {'tags': [f'Тег с id {tag_id} не найден!']},
-                    code='invalid'
-                )
-            if tag in tags_list:
-                raise serializers.ValidationError(
-                    {'tags': ['Теги не должны повторяться!']},
-                    code='duplicate'
-                )
-            tags_list.append(tag)
-        data['tags'] = tags
+        try:
+            ids = [int(tag_id) for tag_id in tags]
+        except (TypeError, ValueError):
+            raise serializers.ValidationError(
+                {'tags': ['Теги передаются списком id!']},
+                code='invalid'
+            )
+        found = Tag.objects.in_bulk(ids)
+        errors = [
+            f'Тег с id {tag_id} не найден!'
+            for tag_id in dict.fromkeys(ids) if tag_id not in found
+        ]
+        if self._find_duplicates(ids):
+            errors.append('Теги не должны повторяться!')
+        if errors:
+            raise serializers.ValidationError({'tags': errors}, code='invalid')
+        data['tags'] = [found[tag_id] for tag_id in ids]
         return data
 
+    def get_tags(self, obj):
+        return get_tag_index(self.context).serialize(
+            item.tag_id for item in obj.recipetag_set.all()
+        )
+
     def get_ingredients(self, obj):
-        ingredients = obj.recipe_ingredients.select_related('ingredient')
-        return [{
-            'id': item.ingredient.id,
-            'name': item.ingredient.name,
-            'measurement_unit': item.ingredient.measurement_unit,
-            'amount': item.amount
-        } for item in ingredients]
+        ingredients = obj.recipe_ingredients.all()
+        if 'recipe_ingredients' not in getattr(
+            obj, '_prefetched_objects_cache', {}
+        ):
+            ingredients = ingredients.select_related('ingredient')
+        return IngredientRecipeSerializer(ingredients, many=True).data
 
     def get_is_favorited(self, obj):
         user = self.context.get('request').user
-        if user.is_authenticated:
-            return obj.favorited_by.filter(user=user).exists()
-        return False
+        if not user.is_authenticated:
+            return False
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
+        return obj.favorited_by.filter(user=user).exists()
 
     def get_is_in_shopping_cart(self, obj):
         user = self.context.get('request').user
         if not user.is_authenticated:
             return False
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         return obj.in_shopping_carts.filter(user=user).exists()
 
     def _create_recipe_ingredients(self, recipe, ingredients_data):
@@ -251,15 +330,57 @@ class RecipeSerializer(serializers.ModelSerializer):
         IngredientRecipe.objects.bulk_create([
             IngredientRecipe(
                 recipe=recipe,
-                ingredient_id=ingredient['id'],
-                amount=ingredient['amount']
+                ingredient=item['ingredient'],
+                amount=item['amount']
             )
-            for ingredient in ingredients_data
+            for item in ingredients_data
         ])
 
+    def _update_recipe_ingredients(self, recipe, ingredients_data):
+        """Применяет к составу рецепта только изменившиеся строки.
+
+        Возвращает True, если состав рецепта изменился.
+        """
+        current = {
+            item.ingredient_id: item
+            for item in recipe.recipe_ingredients.all()
+        }
+        new = {item['ingredient'].id: item for item in ingredients_data}
+        to_delete = current.keys() - new.keys()
+        to_create = []
+        to_update = []
+        for ingredient_id, item in new.items():
+            row = current.get(ingredient_id)
+            if row is None:
+                to_create.append(item)
+            elif row.amount != item['amount']:
+                row.amount = item['amount']
+                to_update.append(row)
+        changed = bool(to_delete or to_update or to_create)
+        if to_delete:
+            # Приёмники строк состава пропускают удаление, как и
+            # bulk_create: рецепт обновляется ниже один раз.
+            with bulk_composition_write():
+                recipe.recipe_ingredients.filter(
+                    ingredient_id__in=to_delete
+                ).delete()
+        if to_update:
+            IngredientRecipe.objects.bulk_update(to_update, ['amount'])
+        if to_create:
+            self._create_recipe_ingredients(recipe, to_create)
+        if len(new) != len(current):
+            Recipe.objects.filter(pk=recipe.pk).update(
+                ingredients_count=len(new)
+            )
+        if changed:
+            # Версию ответов и поисковый вектор обновляет сохранение
+            # рецепта в update().
+            invalidate_recipe_shopping_lists([recipe.id])
+        return changed
+
     @transaction.atomic
     def create(self, validated_data):
-        tags_ids = validated_data.pop('tags', [])
+        tags = validated_data.pop('tags', [])
         ingredients_data = validated_data.pop('ingredients', [])
         author = self.context['request'].user
         if author.is_anonymous:
@@ -269,10 +390,11 @@ class RecipeSerializer(serializers.ModelSerializer):
             )
         recipe = Recipe.objects.create(
             author=author,
+            ingredients_count=len(ingredients_data),
             **validated_data
         )
 
-        recipe.tags.set(tags_ids)
+        recipe.tags.set(tags)
         self._create_recipe_ingredients(recipe, ingredients_data)
         return recipe
 
@@ -281,34 +403,98 @@ class RecipeSerializer(serializers.ModelSerializer):
         if 'image' in self.initial_data:
             self.validate_image({'image': self.initial_data['image']})
 
-        tags_ids = validated_data.pop('tags', [])
+        tags = validated_data.pop('tags', [])
         ingredients_data = validated_data.pop('ingredients', [])
-        image = validated_data.pop('image', None)
 
+        # Новое изображение тоже в validated_data: рецепт сохраняется
+        # одним UPDATE.
         instance = super().update(instance, validated_data)
-
-        if image is not None:
-            instance.image = image
-
-        instance.save()
-        if tags_ids:
-            instance.tags.set(tags_ids)
+        if tags:
+            # set() сам вычисляет разницу с текущими тегами.
+            instance.tags.set(tags)
         if ingredients_data:
-            instance.ingredients.clear()
-            self._create_recipe_ingredients(instance, ingredients_data)
+            self._update_recipe_ingredients(instance, ingredients_data)
         return instance
 
 
-class ShortRecipeSerializer(serializers.ModelSerializer):
+class RecipeMatchSerializer(RecipeSerializer):
+    """Рецепт с покрытием и недостающими ингредиентами.
+
+    Доступные ингредиенты передаются в context['available_ingredients'].
+    """
+    coverage = serializers.FloatField(read_only=True)
+    missing_ingredients = serializers.SerializerMethodField()
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + (
+            'coverage', 'missing_ingredients'
+        )
+
+    def get_missing_ingredients(self, obj):
+        available = self.context['available_ingredients']
+        return IngredientRecipeSerializer(
+            [
+                item for item in obj.recipe_ingredients.all()
+                if item.ingredient_id not in available
+            ],
+            many=True
+        ).data
+
+
+class ShortRecipeSerializer(
+    ProfiledSerializerMixin, serializers.ModelSerializer
+):
+    image = serializers.SerializerMethodField()
+
     class Meta:
         model = Recipe
         fields = ('id', 'name', 'image', 'cooking_time')
 
+    def get_image(self, obj):
+        """Миниатюра, а пока она не готова — исходное изображение."""
+        image = obj.thumbnail or obj.image
+        return image.url if image else None
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для массовых операций с корзиной и избранным."""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=constants.BULK_RECIPES_LIMIT
+    )
+
+    def validate_recipes(self, value):
+        """Проверяет все рецепты одним запросом к базе."""
+        found = Recipe.objects.in_bulk(value)
+        missing = [
+            recipe_id for recipe_id in dict.fromkeys(value)
+            if recipe_id not in found
+        ]
+        if missing:
+            raise serializers.ValidationError(
+                [f'Рецепт {recipe_id} не найден!' for recipe_id in missing]
+            )
+        return [found[recipe_id] for recipe_id in dict.fromkeys(value)]
+
 
-class SubscriptionSerializer(serializers.ModelSerializer):
+class IngredientMatchSerializer(serializers.Serializer):
+    """Параметры подбора рецептов по имеющимся ингредиентам."""
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=constants.MATCH_INGREDIENTS_LIMIT
+    )
+    min_coverage = serializers.FloatField(
+        min_value=0, max_value=1, default=0
+    )
+
+
+class SubscriptionSerializer(
+    ProfiledSerializerMixin, serializers.ModelSerializer
+):
     is_subscribed = serializers.BooleanField(default=True)
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -318,12 +504,11 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         )
 
     def get_recipes(self, obj):
+        if hasattr(obj, 'latest_recipes'):
+            return ShortRecipeSerializer(obj.latest_recipes, many=True).data
         request = self.context.get('request')
         recipes = obj.recipes.all()
         if request and 'recipes_limit' in request.query_params:
             limit = request.query_params['recipes_limit']
             recipes = recipes[:int(limit)]
         return ShortRecipeSerializer(recipes, many=True).data
-
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
@@ -0,0 +1,138 @@
+import csv
+import io
+import json
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+
+from foodgram import constants
+from foodgram.caching import get_version
+from foodgram.models import Ingredient, ShoppingCart
+
+CACHE_KEY = 'shopping_list:{}:{}'
+VERSION_KEY = 'shopping_list_version:{}'
+TITLE = 'Список покупок:'
+HEADER = ('Ингредиент', 'Количество', 'Единица измерения')
+PDF_FONT_NAME = 'ShoppingListFont'
+
+
+def get_shopping_list(user):
+    """Возвращает список покупок пользователя.
+
+    Результат агрегации кешируется до изменения корзины пользователя
+    или состава рецептов в ней: ключ включает версию списка.
+    """
+    key = CACHE_KEY.format(user.id, get_version(VERSION_KEY.format(user.id)))
+    items = cache.get(key)
+    if items is None:
+        items = list(Ingredient.objects.filter(
+            ingredientrecipe__recipe__in_shopping_carts__user=user
+        ).annotate(
+            total_amount=Sum('ingredientrecipe__amount')
+        ).order_by('name').values_list(
+            'name', 'measurement_unit', 'total_amount'
+        ))
+        cache.set(key, items, constants.SHOPPING_LIST_CACHE_TIMEOUT)
+    return items
+
+
+def invalidate_shopping_lists(user_ids):
+    """Меняет версии списков покупок после фиксации транзакции.
+
+    Список, посчитанный одновременно со сменой версии, сохраняется под
+    старым ключом и больше не читается, а не подменяет свежий.
+    """
+    keys = [VERSION_KEY.format(user_id) for user_id in set(user_ids)]
+    if keys:
+        transaction.on_commit(
+            lambda: cache.set_many(dict.fromkeys(keys, uuid4().hex), None)
+        )
+
+
+def invalidate_recipe_shopping_lists(recipe_ids):
+    """Сбрасывает кеш у всех, у кого рецепты лежат в корзине."""
+    invalidate_shopping_lists(ShoppingCart.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('user_id', flat=True))
+
+
+class Echo:
+    """Псевдобуфер для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def render_txt(items):
+    yield f'{TITLE}\n\n'
+    for name, measurement_unit, amount in items:
+        yield f'{name} - {amount} {measurement_unit}\n'
+
+
+def render_csv(items):
+    writer = csv.writer(Echo())
+    yield writer.writerow(HEADER)
+    for name, measurement_unit, amount in items:
+        yield writer.writerow((name, amount, measurement_unit))
+
+
+def render_json(items):
+    yield '['
+    for index, (name, measurement_unit, amount) in enumerate(items):
+        separator = ',' if index else ''
+        yield separator + json.dumps({
+            'name': name,
+            'amount': amount,
+            'measurement_unit': measurement_unit,
+        }, ensure_ascii=False)
+    yield ']'
+
+
+def render_pdf(items):
+    """PDF собирается целиком в буфере и отдаётся частями:
+    таблица ссылок формата пишется только в конце документа."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFError, TTFont
+    from reportlab.pdfgen import canvas
+
+    font = PDF_FONT_NAME
+    if font not in pdfmetrics.getRegisteredFontNames():
+        try:
+            pdfmetrics.registerFont(
+                TTFont(font, settings.SHOPPING_LIST_PDF_FONT)
+            )
+        except (OSError, TTFError):
+            # Без TTF-шрифта кириллица не отрисуется, но файл соберётся.
+            font = 'Helvetica'
+
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    margin = constants.PDF_MARGIN
+    line_height = constants.PDF_LINE_HEIGHT
+    y = height - margin
+    pdf.setFont(font, constants.PDF_FONT_SIZE)
+    pdf.drawString(margin, y, TITLE)
+    y -= line_height * 2
+    for name, measurement_unit, amount in items:
+        if y < margin:
+            pdf.showPage()
+            pdf.setFont(font, constants.PDF_FONT_SIZE)
+            y = height - margin
+        pdf.drawString(margin, y, f'{name} - {amount} {measurement_unit}')
+        y -= line_height
+    pdf.save()
+    buffer.seek(0)
+    yield from iter(lambda: buffer.read(constants.STREAM_CHUNK_SIZE), b'')
+
+
+EXPORT_FORMATS = {
+    'txt': (render_txt, 'text/plain; charset=utf-8'),
+    'csv': (render_csv, 'text/csv; charset=utf-8'),
+    'json': (render_json, 'application/json; charset=utf-8'),
+    'pdf': (render_pdf, 'application/pdf'),
+}
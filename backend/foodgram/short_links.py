@@ -0,0 +1,61 @@
+from django.core.cache import cache
+from django.db import transaction
+
+from foodgram import constants
+from foodgram.models import Recipe
+
+CACHE_KEY = 'short_link:{}'
+# Отрицательный результат: такого кода нет.
+MISSING = 0
+
+
+def get_timeout(recipe_id):
+    if recipe_id:
+        return constants.SHORT_LINK_CACHE_TIMEOUT
+    return constants.SHORT_LINK_MISSING_TIMEOUT
+
+
+def resolve_short_code(code):
+    """Возвращает id рецепта по короткому коду или None.
+
+    Найденные и отсутствующие коды кешируются, поэтому повторные
+    переходы по ссылке не обращаются к базе данных.
+    """
+    if len(code) != constants.SHORT_URL_LEN:
+        return None
+    key = CACHE_KEY.format(code)
+    recipe_id = cache.get(key)
+    if recipe_id is None:
+        recipe_id = Recipe.objects.filter(
+            short_url=code
+        ).values_list('id', flat=True).first() or MISSING
+        cache.set(key, recipe_id, get_timeout(recipe_id))
+    return recipe_id or None
+
+
+async def aresolve_short_code(code):
+    if len(code) != constants.SHORT_URL_LEN:
+        return None
+    key = CACHE_KEY.format(code)
+    recipe_id = await cache.aget(key)
+    if recipe_id is None:
+        recipe_id = await Recipe.objects.filter(
+            short_url=code
+        ).values_list('id', flat=True).afirst() or MISSING
+        await cache.aset(key, recipe_id, get_timeout(recipe_id))
+    return recipe_id or None
+
+
+def remember_short_code(recipe):
+    """Прогревает кеш после фиксации транзакции, заменяя отрицательный
+    результат, если код уже запрашивали."""
+    key = CACHE_KEY.format(recipe.short_url)
+    recipe_id = recipe.id
+    transaction.on_commit(lambda: cache.set(
+        key, recipe_id, constants.SHORT_LINK_CACHE_TIMEOUT
+    ))
+
+
+def forget_short_code(code):
+    key = CACHE_KEY.format(code)
+    transaction.on_commit(lambda: cache.delete(key))
@@ -0,0 +1,228 @@
+from django.core.signals import request_started
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from foodgram import constants, tag_catalog
+from foodgram.caching import RECIPES_VERSION_KEY, bump_version
+from foodgram.feed import use_fan_out_on_write
+from foodgram.images import build_rendition, get_rendition_name, pipeline
+from foodgram.ingredient_search import catalog
+from foodgram.instrumentation import install_query_recorder
+from foodgram.metrics import registry
+from foodgram.models import (Favorite, FeedEntry, Ingredient, IngredientRecipe,
+                             Recipe, ShoppingCart, Subscription, Tag, User,
+                             composition_bulk_write, relations_changed,
+                             update_counter)
+from foodgram.recipe_search import (schedule_recipe_search_update,
+                                    schedule_search_update)
+from foodgram.shopping_list import (invalidate_recipe_shopping_lists,
+                                    invalidate_shopping_lists)
+from foodgram.short_links import forget_short_code, remember_short_code
+
+# Поля рецепта, из которых строится поисковый вектор. Состав рецепта
+# учитывается приёмником строк состава, а массовые изменения в
+# сериализаторе — сохранением самого рецепта.
+SEARCH_FIELDS = {'name', 'text'}
+
+
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def shopping_cart_changed(sender, instance, **kwargs):
+    invalidate_shopping_lists([instance.user_id])
+
+
+def is_bulk_composition_write(sender):
+    return sender is IngredientRecipe and composition_bulk_write.get()
+
+
+@receiver((post_save, post_delete), sender=IngredientRecipe)
+def recipe_ingredients_changed(sender, instance, **kwargs):
+    if is_bulk_composition_write(sender):
+        return
+    invalidate_recipe_shopping_lists([instance.recipe_id])
+    schedule_recipe_search_update(
+        Recipe.objects.using(kwargs['using']), instance.recipe_id
+    )
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_changed(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_recipe_shopping_lists(
+            instance.recipes.values_list('id', flat=True)
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_search_changed(sender, instance, update_fields, **kwargs):
+    if update_fields is None or SEARCH_FIELDS & set(update_fields):
+        schedule_recipe_search_update(
+            Recipe.objects.using(kwargs['using']), instance.pk
+        )
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_search_changed(sender, instance, created, **kwargs):
+    if not created:
+        schedule_search_update(Recipe.objects.filter(ingredients=instance))
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_catalog_changed(sender, **kwargs):
+    catalog.invalidate()
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_catalog_changed(sender, **kwargs):
+    tag_catalog.catalog.invalidate()
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=IngredientRecipe)
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+def recipes_changed(sender, **kwargs):
+    if is_bulk_composition_write(sender):
+        return
+    bump_version(RECIPES_VERSION_KEY)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, action, **kwargs):
+    if action.startswith('post_'):
+        bump_version(RECIPES_VERSION_KEY)
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, update_fields, **kwargs):
+    """Данные автора вложены в ответы со списком рецептов."""
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    bump_version(RECIPES_VERSION_KEY)
+
+
+RECIPE_COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'shopping_cart_count',
+    IngredientRecipe: 'ingredients_count',
+}
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=IngredientRecipe)
+def recipe_counter_increased(sender, instance, created, **kwargs):
+    if created and not is_bulk_composition_write(sender):
+        update_counter(
+            Recipe.objects.filter(pk=instance.recipe_id),
+            RECIPE_COUNTERS[sender],
+            1
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=IngredientRecipe)
+def recipe_counter_decreased(sender, instance, **kwargs):
+    if is_bulk_composition_write(sender):
+        return
+    update_counter(
+        Recipe.objects.filter(pk=instance.recipe_id),
+        RECIPE_COUNTERS[sender],
+        -1
+    )
+
+
+@receiver(relations_changed, sender=Favorite)
+@receiver(relations_changed, sender=ShoppingCart)
+def recipe_counters_changed(sender, object_ids, delta, **kwargs):
+    update_counter(
+        Recipe.objects.filter(pk__in=object_ids),
+        RECIPE_COUNTERS[sender],
+        delta
+    )
+
+
+@receiver(relations_changed, sender=ShoppingCart)
+def shopping_cart_relations_changed(sender, user_id, **kwargs):
+    invalidate_shopping_lists([user_id])
+
+
+@receiver(post_save, sender=Recipe)
+def author_counter_increased(sender, instance, created, **kwargs):
+    if created:
+        update_counter(
+            User.objects.filter(pk=instance.author_id), 'recipes_count', 1
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def author_counter_decreased(sender, instance, **kwargs):
+    update_counter(
+        User.objects.filter(pk=instance.author_id), 'recipes_count', -1
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_published(sender, instance, created, **kwargs):
+    if created and use_fan_out_on_write():
+        FeedEntry.objects.fan_out(instance.pk)
+
+
+@receiver(relations_changed, sender=Subscription)
+def feed_subscriptions_changed(sender, user_id, object_ids, delta, **kwargs):
+    if not use_fan_out_on_write():
+        return
+    if delta > 0:
+        FeedEntry.objects.backfill(user_id, object_ids)
+    else:
+        FeedEntry.objects.remove_authors(user_id, object_ids)
+
+
+@receiver(post_save, sender=Recipe)
+def short_link_saved(sender, instance, **kwargs):
+    remember_short_code(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def short_link_deleted(sender, instance, **kwargs):
+    forget_short_code(instance.short_url)
+
+
+# Модель: (поле исходника, поле копии, размер копии).
+RENDITIONS = {
+    Recipe: ('image', 'thumbnail', constants.RECIPE_THUMBNAIL_SIZE),
+    User: ('avatar', 'avatar', constants.AVATAR_SIZE),
+}
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def image_saved(sender, instance, **kwargs):
+    """Ставит в очередь уменьшенную копию, если она не соответствует
+    текущему изображению."""
+    source_field, target_field, size = RENDITIONS[sender]
+    source = getattr(instance, source_field)
+    if not source:
+        return
+    target = getattr(instance, target_field)
+    if target.name != get_rendition_name(source.name, size):
+        pipeline.submit(
+            build_rendition, sender, instance.pk,
+            source_field, target_field, size
+        )
+
+
+@receiver(request_started)
+def request_counted(sender, **kwargs):
+    registry.inc('foodgram_requests_total')
+
+
+@receiver(connection_created)
+def connection_created_handler(sender, connection, **kwargs):
+    """Доля новых соединений на запрос показывает, работают ли
+    постоянные соединения и пул."""
+    install_query_recorder(connection)
+    registry.inc(
+        'foodgram_db_connections_opened_total', alias=connection.alias
+    )
@@ -0,0 +1,25 @@
+import os
+import re
+
+from django.core.files.storage import FileSystemStorage
+
+HASHED_NAME = re.compile(r'^[0-9a-f]{64}(_\d+x\d+)?\.\w+$')
+
+
+class ContentHashStorage(FileSystemStorage):
+    """Хранилище, в котором файлы названы по хешу содержимого.
+
+    Повторная загрузка того же изображения не записывается заново,
+    а ссылается на уже сохранённый файл. Остальные имена обрабатываются
+    как в FileSystemStorage.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        if HASHED_NAME.match(os.path.basename(name)):
+            return name
+        return super().get_available_name(name, max_length)
+
+    def _save(self, name, content):
+        if HASHED_NAME.match(os.path.basename(name)) and self.exists(name):
+            return name
+        return super()._save(name, content)
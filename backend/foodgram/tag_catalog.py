@@ -0,0 +1,104 @@
+import time
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+
+from foodgram import constants
+from foodgram.caching import get_etag
+from foodgram.models import Tag
+
+
+class TagIndex:
+    """Снимок справочника тегов с готовыми ответами API."""
+
+    def __init__(self, tags, version):
+        from foodgram.serializers import TagSerializer
+
+        self.tags = list(tags)
+        self.version = version
+        self.data = TagSerializer(self.tags, many=True).data
+        self.by_id = {tag.id: tag for tag in self.tags}
+        self.data_by_id = {item['id']: item for item in self.data}
+        self.slugs = {tag.slug: tag.id for tag in self.tags}
+        self.positions = {tag.id: position for position, tag in enumerate(
+            self.tags
+        )}
+        self.loaded_at = time.monotonic()
+        # ETag по содержимому совпадает у всех воркеров и меняется
+        # при перезагрузке по сроку, даже если версия та же.
+        self.etag = get_etag(self.data)
+
+    def serialize(self, tag_ids):
+        """Теги рецепта в порядке справочника, как при prefetch.
+
+        Тег, добавленный в другом воркере до смены версии, пропускается.
+        """
+        return [
+            self.data_by_id[tag_id]
+            for tag_id in sorted(
+                (tag_id for tag_id in tag_ids if tag_id in self.positions),
+                key=self.positions.__getitem__
+            )
+        ]
+
+
+class TagCatalog:
+    """Справочник тегов в памяти процесса.
+
+    Как и каталог ингредиентов, сверяется с версией в общем кеше:
+    после изменения тегов каждый воркер перечитывает их при следующем
+    обращении. С кешем в памяти процесса версия до других воркеров
+    не доходит, поэтому снимок ещё и живёт не дольше
+    TAG_CATALOG_SNAPSHOT_TTL секунд.
+    """
+    version_key = 'tag_catalog_version'
+
+    def __init__(self):
+        self.index = None
+
+    def get_index(self):
+        version = cache.get_or_set(self.version_key, uuid4().hex, None)
+        if (
+            self.index is None
+            or self.index.version != version
+            or time.monotonic() - self.index.loaded_at
+            > constants.TAG_CATALOG_SNAPSHOT_TTL
+        ):
+            self.index = TagIndex(Tag.objects.all(), version)
+        return self.index
+
+    def invalidate(self):
+        """Сбрасывает справочник во всех воркерах после фиксации."""
+        self.index = None
+        transaction.on_commit(
+            lambda: cache.set(self.version_key, uuid4().hex, None)
+        )
+
+
+catalog = TagCatalog()
+
+
+def get_tag_ids(slugs):
+    """id известных тегов; неизвестные слаги пропускаются."""
+    slug_map = catalog.get_index().slugs
+    return [slug_map[slug] for slug in slugs if slug in slug_map]
+
+
+def finalize_catalog_response(request, response, index):
+    """Сильный ETag по версии справочника и долгий Cache-Control.
+
+    Ответ одинаков для всех пользователей, поэтому разрешено
+    общее кеширование; при совпадении If-None-Match отдаётся 304.
+    """
+    if index.etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    response['ETag'] = index.etag
+    patch_cache_control(
+        response, public=True, max_age=constants.TAG_CATALOG_MAX_AGE
+    )
+    patch_vary_headers(response, ('Accept',))
+    return response
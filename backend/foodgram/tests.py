@@ -1,10 +1,33 @@
+import io
+import itertools
+import json
+import tempfile
 from http import HTTPStatus
+from pathlib import Path
+from unittest import mock
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 
-from foodgram.models import Recipe
+from foodgram import async_views, benchmarks, constants, shopping_list
+from foodgram.caching import get_version
+from foodgram.checks import ingredient_catalog_check, shared_cache_check
+from foodgram.ingredient_search import catalog
+from foodgram.management.commands.load_ingredients import iter_json
+from foodgram.models import (Favorite, FeedEntry, Ingredient, IngredientRecipe,
+                             Recipe, ShoppingCart, Subscription, Tag)
+from foodgram.paginations import FoodgramPagination, KeysetPagination
+from foodgram.shopping_list import get_shopping_list
+from foodgram.tag_catalog import catalog as tag_catalog
+from foodgram_backend import urls as project_urls
 
 
 class RecipeAPITestCase(TestCase):
@@ -55,3 +78,1433 @@ class RecipeAPITestCase(TestCase):
             HTTPStatus.UNAUTHORIZED,
             msg='Неавторизованные пользователи не могут создавать рецепты'
         )
+
+    def test_subscribe_response(self):
+        """Ответ на подписку показывает, что подписка оформлена."""
+        author = get_user_model().objects.create_user(
+            username='author', email='author@example.com', password='pass'
+        )
+        response = self.client.post(f'/api/users/{author.id}/subscribe/')
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assertTrue(response.data['is_subscribed'])
+        self.assertEqual(response.data['recipes_count'], 0)
+
+
+class RecipeQueryCountTestCase(TestCase):
+    RECIPES_COUNT = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(
+            username='reader',
+            email='reader@example.com',
+            password='testpass123'
+        )
+        tags = [
+            Tag.objects.create(name=f'Тег {i}', slug=f'tag-{i}')
+            for i in range(2)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {i}', measurement_unit='г'
+            )
+            for i in range(3)
+        ]
+        for i in range(cls.RECIPES_COUNT):
+            author = User.objects.create_user(
+                username=f'author_{i}',
+                email=f'author_{i}@example.com',
+                password='testpass123'
+            )
+            recipe = Recipe.objects.create(
+                author=author,
+                name=f'Рецепт {i}',
+                text='Описание',
+                cooking_time=10
+            )
+            recipe.tags.set(tags)
+            IngredientRecipe.objects.bulk_create([
+                IngredientRecipe(
+                    recipe=recipe, ingredient=ingredient, amount=5
+                )
+                for ingredient in ingredients
+            ])
+            Favorite.objects.create(user=cls.user, recipe=recipe)
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+            Subscription.objects.create(user=cls.user, author=author)
+
+    def setUp(self):
+        cache.clear()
+        tag_catalog.get_index()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return len(context.captured_queries)
+
+    def test_list_query_count_does_not_depend_on_limit(self):
+        """Число запросов к списку рецептов не растёт вместе с limit."""
+        small_page = self.count_queries('/api/recipes/?limit=1')
+        full_page = self.count_queries(
+            f'/api/recipes/?limit={self.RECIPES_COUNT}'
+        )
+        self.assertEqual(
+            small_page,
+            full_page,
+            msg='Список рецептов не должен делать запросы на каждый рецепт'
+        )
+
+    def test_users_query_count_does_not_depend_on_limit(self):
+        """Число запросов к списку пользователей не растёт вместе с limit."""
+        self.assertEqual(
+            self.count_queries('/api/users/?limit=1'),
+            self.count_queries(f'/api/users/?limit={self.RECIPES_COUNT}'),
+            msg='is_subscribed не должен проверяться отдельным запросом'
+        )
+
+    def test_subscriptions_query_count_does_not_depend_on_limit(self):
+        """Лента подписок загружается фиксированным числом запросов."""
+        url = '/api/users/subscriptions/?recipes_limit=1&limit={}'
+        self.assertEqual(
+            self.count_queries(url.format(1)),
+            self.count_queries(url.format(self.RECIPES_COUNT)),
+            msg='Рецепты авторов не должны загружаться по одному'
+        )
+        response = self.client.get(url.format(1))
+        author = response.data['results'][0]
+        self.assertEqual(author['recipes_count'], 1)
+        self.assertEqual(len(author['recipes']), 1)
+
+    def walk_cursor(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            ids += [item['id'] for item in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_keyset_pagination(self):
+        """Курсорная пагинация проходит все записи без повторов."""
+        ids = self.walk_cursor('/api/recipes/?cursor=&limit=3')
+        self.assertEqual(
+            ids, list(Recipe.objects.values_list('id', flat=True))
+        )
+        ids = self.walk_cursor('/api/users/subscriptions/?cursor=&limit=3')
+        self.assertEqual(len(ids), self.RECIPES_COUNT)
+        self.assertEqual(ids, sorted(ids))
+
+    def test_keyset_pagination_ordering(self):
+        """Курсор продолжает запрошенную сортировку, а не подменяет её."""
+        for index, recipe in enumerate(Recipe.objects.order_by('id')):
+            Recipe.objects.filter(pk=recipe.pk).update(
+                favorites_count=index % 3
+            )
+        expected = list(Recipe.objects.order_by(
+            '-favorites_count', '-id'
+        ).values_list('id', flat=True))
+        ids = self.walk_cursor(
+            '/api/recipes/?cursor=&limit=3&ordering=-favorites_count'
+        )
+        self.assertEqual(ids, expected)
+        response = self.client.get('/api/recipes/?cursor=&search=рецепт')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_page_size_limit(self):
+        for pagination, url in (
+            (FoodgramPagination, '/api/recipes/?limit=5'),
+            (KeysetPagination, '/api/recipes/?cursor=&limit=5'),
+        ):
+            with mock.patch.object(pagination, 'max_page_size', 2):
+                response = self.client.get(url)
+            self.assertEqual(len(response.data['results']), 2)
+
+    def test_tags_filter(self):
+        """Рецепт с несколькими тегами попадает в выборку один раз."""
+        url = '/api/recipes/?tags=tag-0&tags=tag-1&is_favorited=1&limit=50'
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        ids = [recipe['id'] for recipe in response.data['results']]
+        self.assertEqual(response.data['count'], self.RECIPES_COUNT)
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertFalse(any(
+            'DISTINCT' in query['sql'] for query in context.captured_queries
+        ))
+        response = self.client.get('/api/recipes/?tags=unknown')
+        self.assertEqual(response.data['count'], 0)
+
+    def test_list_flags(self):
+        """Аннотированные флаги совпадают с данными в базе."""
+        response = self.client.get('/api/recipes/?limit=1')
+        recipe = response.data['results'][0]
+        self.assertTrue(recipe['is_favorited'])
+        self.assertTrue(recipe['is_in_shopping_cart'])
+        self.assertTrue(recipe['author']['is_subscribed'])
+        self.assertEqual(len(recipe['tags']), 2)
+        self.assertEqual(len(recipe['ingredients']), 3)
+
+
+class ShoppingListTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(
+            username='buyer',
+            email='buyer@example.com',
+            password='testpass123'
+        )
+        cls.ingredient = Ingredient.objects.create(
+            name='Мука', measurement_unit='г'
+        )
+        for amount in (100, 200):
+            recipe = Recipe.objects.create(
+                author=cls.user,
+                name=f'Рецепт {amount}',
+                text='Описание',
+                cooking_time=10
+            )
+            IngredientRecipe.objects.create(
+                recipe=recipe, ingredient=cls.ingredient, amount=amount
+            )
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        cls.recipe = recipe
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def download(self, file_format):
+        response = self.client.get(
+            f'/api/recipes/download_shopping_cart/?format={file_format}'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return b''.join(response.streaming_content)
+
+    def test_formats(self):
+        """Список покупок выгружается во всех поддерживаемых форматах."""
+        self.assertIn('Мука - 300 г', self.download('txt').decode())
+        self.assertIn('Мука,300,г', self.download('csv').decode())
+        self.assertEqual(
+            json.loads(self.download('json')),
+            [{'name': 'Мука', 'amount': 300, 'measurement_unit': 'г'}]
+        )
+        self.assertTrue(self.download('pdf').startswith(b'%PDF'))
+
+    def test_unknown_format(self):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/?format=doc'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_cache_invalidation(self):
+        """Кеш сбрасывается при изменении состава рецепта в корзине."""
+        self.download('txt')
+        with self.assertNumQueries(0):
+            self.download('txt')
+        ingredient_recipe = IngredientRecipe.objects.get(recipe=self.recipe)
+        ingredient_recipe.amount = 1
+        with self.captureOnCommitCallbacks(execute=True):
+            ingredient_recipe.save()
+        self.assertIn('Мука - 101 г', self.download('txt').decode())
+
+    def test_concurrent_download_not_cached(self):
+        """Список, посчитанный до сброса и записанный после, не читается."""
+        user_id = self.user.id
+        key = shopping_list.CACHE_KEY.format(user_id, get_version(
+            shopping_list.VERSION_KEY.format(user_id)
+        ))
+        stale = shopping_list.get_shopping_list(self.user)
+        ingredient_recipe = IngredientRecipe.objects.get(recipe=self.recipe)
+        ingredient_recipe.amount = 1
+        with self.captureOnCommitCallbacks(execute=True):
+            ingredient_recipe.save()
+        # Запоздавшая запись одновременной выгрузки.
+        cache.set(key, stale)
+        self.assertEqual(
+            shopping_list.get_shopping_list(self.user), [('Мука', 'г', 101)]
+        )
+
+
+class IngredientSearchTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create([
+            Ingredient(name=f'Сахар {i}', measurement_unit='г')
+            for i in range(constants.INGREDIENT_SEARCH_LIMIT + 5)
+        ] + [
+            Ingredient(name='Соль', measurement_unit='г'),
+            Ingredient(name='Морская соль', measurement_unit='г'),
+        ])
+
+    def setUp(self):
+        catalog.invalidate()
+        self.client = APIClient()
+
+    def test_prefix_search(self):
+        """Поиск идёт по началу названия без учёта регистра."""
+        response = self.client.get('/api/ingredients/?name=соль')
+        self.assertEqual(
+            [item['name'] for item in response.data], ['Соль']
+        )
+
+    def test_result_limit(self):
+        response = self.client.get('/api/ingredients/?name=сах')
+        self.assertEqual(
+            len(response.data), constants.INGREDIENT_SEARCH_LIMIT
+        )
+
+    @override_settings(INGREDIENT_CATALOG_IN_MEMORY=True)
+    def test_catalog_serves_without_queries(self):
+        """Каталог в памяти отвечает без обращения к базе."""
+        self.client.get('/api/ingredients/?name=соль')
+        salt = Ingredient.objects.get(name='Соль')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/ingredients/?name=соль')
+            self.client.get(f'/api/ingredients/{salt.id}/')
+        self.assertEqual(response.data[0]['id'], salt.id)
+
+    @override_settings(INGREDIENT_CATALOG_IN_MEMORY=True)
+    def test_catalog_invalidation(self):
+        """Изменение ингредиента видно после смены версии каталога."""
+        self.client.get('/api/ingredients/?name=соль')
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='Солод', measurement_unit='г')
+        response = self.client.get('/api/ingredients/?name=сол')
+        self.assertEqual(
+            [item['name'] for item in response.data], ['Солод', 'Соль']
+        )
+
+    def test_catalog_requires_shared_cache(self):
+        """Каталог в памяти не включается без общего кеша."""
+        redis = {'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        }}
+        for setting, caches, errors in (
+            (False, settings.CACHES, []),
+            (True, settings.CACHES, ['foodgram.E001']),
+            (True, redis, []),
+        ):
+            overrides = override_settings(
+                INGREDIENT_CATALOG_IN_MEMORY=setting, CACHES=caches
+            )
+            with self.subTest(setting=setting, caches=caches), overrides:
+                self.assertEqual(
+                    [error.id for error in ingredient_catalog_check(None)],
+                    errors
+                )
+
+    def test_local_cache_warning(self):
+        """Предупреждение о кеше в памяти одного процесса."""
+        for backend, errors in (
+            ('locmem.LocMemCache', ['foodgram.W001']),
+            ('redis.RedisCache', []),
+            ('dummy.DummyCache', []),
+        ):
+            caches = {'default': {
+                'BACKEND': f'django.core.cache.backends.{backend}',
+            }}
+            with self.subTest(backend=backend), \
+                    override_settings(CACHES=caches):
+                self.assertEqual(
+                    [error.id for error in shared_cache_check(None)], errors
+                )
+
+
+class LoadIngredientsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def load(self, name, content, *args):
+        path = self.directory / name
+        path.write_text(content, encoding='utf-8')
+        stdout = io.StringIO()
+        call_command(
+            'load_ingredients', '--path', str(path), *args, stdout=stdout
+        )
+        return stdout.getvalue()
+
+    def load_json(self, items, *args):
+        return self.load(
+            'ingredients.json', json.dumps(items, ensure_ascii=False), *args
+        )
+
+    def units(self):
+        return dict(
+            Ingredient.objects.values_list('name', 'measurement_unit')
+        )
+
+    def test_load_json(self):
+        self.load(
+            'ingredients.json',
+            ' [ {"name": " соль ", "measurement_unit": "г"} ,\n'
+            '{"name": "молоко", "measurement_unit": "мл"}, '
+            '{"name": "", "measurement_unit": "г"} ] '
+        )
+        self.assertEqual(self.units(), {'соль': 'г', 'молоко': 'мл'})
+
+    def test_iter_json_chunks(self):
+        items = [
+            {'name': f'ингредиент {index}', 'measurement_unit': 'г'}
+            for index in range(10)
+        ]
+        text = json.dumps(items, ensure_ascii=False, indent=2)
+        self.assertEqual(
+            list(iter_json(io.StringIO(text), chunk_size=3)), items
+        )
+        self.assertEqual(list(iter_json(io.StringIO(' [ ] '))), [])
+
+    def test_load_csv(self):
+        self.load('ingredients.csv', 'соль,г\n"мука, пшеничная",г\nлишнее\n')
+        self.assertEqual(self.units(), {'соль': 'г', 'мука, пшеничная': 'г'})
+
+    def test_invalid_json(self):
+        for content in (
+            '[{"name": "соль", "measurement_unit": "г"}',
+            '[{"name": "соль", "measurement_unit": "г"},',
+            '[{"name": }]',
+            '{"name": "соль", "measurement_unit": "г"}',
+            '',
+        ):
+            with self.subTest(content=content):
+                with self.assertRaises(CommandError):
+                    self.load('ingredients.json', content)
+        self.assertFalse(Ingredient.objects.exists())
+
+    def test_malformed_item(self):
+        for items in (
+            [{'name': 'соль'}],
+            [{'name': 1, 'measurement_unit': 'г'}],
+            ['соль'],
+            [None],
+        ):
+            with self.subTest(items=items):
+                with self.assertRaisesMessage(
+                    CommandError, 'Некорректный ингредиент №2'
+                ):
+                    self.load_json(
+                        [{'name': 'перец', 'measurement_unit': 'г'}] + items
+                    )
+        self.assertFalse(Ingredient.objects.exists())
+
+    def test_batch_size(self):
+        items = [
+            {'name': f'ингредиент {index}', 'measurement_unit': 'г'}
+            for index in range(5)
+        ]
+        output = self.load_json(items, '--batch-size', '2')
+        self.assertEqual(Ingredient.objects.count(), 5)
+        self.assertEqual(output.splitlines(), [
+            'Обработано 2 ингредиентов',
+            'Обработано 4 ингредиентов',
+            'Обработано 5 ингредиентов',
+            'Обработано ингредиентов: 5, добавлено: 5, обновлено: 0',
+        ])
+        with self.assertRaises(CommandError):
+            self.load_json(items, '--batch-size', '0')
+
+    def test_duplicate_names_in_batch(self):
+        self.load_json([
+            {'name': 'соль', 'measurement_unit': 'г'},
+            {'name': 'соль ', 'measurement_unit': 'кг'},
+        ])
+        self.assertEqual(self.units(), {'соль': 'кг'})
+
+    def test_update(self):
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        items = [
+            {'name': 'соль', 'measurement_unit': 'кг'},
+            {'name': 'перец', 'measurement_unit': 'г'},
+        ]
+        output = self.load_json(items)
+        self.assertIn('добавлено: 1, обновлено: 0', output)
+        self.assertEqual(self.units(), {'соль': 'г', 'перец': 'г'})
+        output = self.load_json(items, '--update')
+        self.assertIn('добавлено: 0, обновлено: 1', output)
+        self.assertEqual(self.units(), {'соль': 'кг', 'перец': 'г'})
+
+    def test_update_invalidates_caches(self):
+        user = get_user_model().objects.create_user(
+            username='cook', email='cook@example.com', password='pass'
+        )
+        salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+        recipe = Recipe.objects.create(
+            author=user, name='Суп', text='Варить', cooking_time=10
+        )
+        IngredientRecipe.objects.create(
+            recipe=recipe, ingredient=salt, amount=5
+        )
+        ShoppingCart.objects.create(user=user, recipe=recipe)
+        client = APIClient()
+        url = f'/api/recipes/{recipe.id}/'
+        client.get(url)
+        self.assertEqual(get_shopping_list(user), [('соль', 'г', 5)])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.load_json(
+                [{'name': 'соль', 'measurement_unit': 'кг'}], '--update'
+            )
+        self.assertEqual(
+            client.get(url).data['ingredients'][0]['measurement_unit'], 'кг'
+        )
+        self.assertEqual(get_shopping_list(user), [('соль', 'кг', 5)])
+
+
+class RecipeWriteTestCase(TestCase):
+    IMAGE = (
+        'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAgMAAABieywa'
+        'AAAACVBMVEUAAAD///9fX1/S0ecCAAAACXBIWXMAAA7EAAAOxAGVKw4bAAAACklEQV'
+        'QImWNoAAAAggCByxOyYQAAAABJRU5ErkJggg=='
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(
+            username='cook',
+            email='cook@example.com',
+            password='testpass123'
+        )
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {i}', slug=f'tag-{i}')
+            for i in range(2)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {i}', measurement_unit='г'
+            )
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def payload(self, ingredients, tags):
+        return {
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': self.IMAGE,
+            'ingredients': [
+                {'id': ingredient_id, 'amount': amount}
+                for ingredient_id, amount in ingredients
+            ],
+            'tags': tags,
+        }
+
+    def test_tags_validated_against_database(self):
+        """Устаревший снимок справочника тегов не влияет на запись."""
+        deleted = Tag.objects.create(name='Удалённый', slug='deleted')
+        stale = tag_catalog.get_index()
+        created = Tag.objects.create(name='Новый', slug='new')
+        deleted.delete()
+        ingredients = [(self.ingredients[0].id, 1)]
+        # Снимок воркера, до которого изменения тегов ещё не дошли.
+        with mock.patch.object(tag_catalog, 'index', stale):
+            response = self.client.post(
+                '/api/recipes/', self.payload(ingredients, [deleted.id]),
+                format='json'
+            )
+            self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+            self.assertIn('tags', response.data)
+            response = self.client.post(
+                '/api/recipes/', self.payload(ingredients, [created.id]),
+                format='json'
+            )
+            self.assertEqual(response.status_code, HTTPStatus.CREATED)
+
+    @override_settings(IMAGE_PIPELINE_SYNC=True)
+    def test_image_deduplicated_and_thumbnailed(self):
+        payload = self.payload(
+            [(self.ingredients[0].id, 1)], [self.tags[0].id]
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.client.post('/api/recipes/', payload, format='json')
+            second = self.client.post('/api/recipes/', payload, format='json')
+        self.assertEqual(first.data['image'], second.data['image'])
+        recipe = Recipe.objects.get(pk=first.data['id'])
+        self.assertRegex(recipe.image.name, r'/[0-9a-f]{64}\.png$')
+        self.assertTrue(recipe.thumbnail.name.endswith('_480x480.webp'))
+        self.assertTrue(recipe.thumbnail.storage.exists(recipe.thumbnail.name))
+        response = self.client.post(f'/api/recipes/{recipe.id}/favorite/')
+        self.assertEqual(response.data['image'], recipe.thumbnail.url)
+        response = self.client.get('/api/recipes/')
+        self.assertTrue(
+            response.data['results'][0]['image'].endswith(
+                recipe.thumbnail.url
+            )
+        )
+        response = self.client.get(f'/api/recipes/{recipe.id}/')
+        self.assertTrue(response.data['image'].endswith(recipe.image.url))
+
+    def test_avatar_delete_keeps_shared_file(self):
+        """Одинаковые аватары — один файл, удаление не задевает других."""
+        other = get_user_model().objects.create_user(
+            username='other', email='other@example.com', password='pass'
+        )
+        for user in (self.user, other):
+            self.client.force_authenticate(user=user)
+            response = self.client.put(
+                '/api/users/me/avatar/', {'avatar': self.IMAGE},
+                format='json'
+            )
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+        other.refresh_from_db()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.avatar.name, other.avatar.name)
+        response = self.client.delete('/api/users/me/avatar/')
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+        other.refresh_from_db()
+        self.assertFalse(other.avatar)
+        self.assertTrue(
+            self.user.avatar.storage.exists(self.user.avatar.name)
+        )
+
+    def test_validation_reports_all_errors(self):
+        """Все ошибки ингредиентов и тегов возвращаются одним ответом."""
+        ingredient = self.ingredients[0]
+        response = self.client.post('/api/recipes/', self.payload(
+            [(ingredient.id, 1), (ingredient.id, 0), (0, 1)], [0]
+        ), format='json')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertEqual(len(response.data['ingredients']), 2)
+        self.assertIn('amount', response.data)
+        self.assertIn('tags', response.data)
+
+    def test_validation_query_count(self):
+        """Проверка ингредиентов не делает запрос на каждый ингредиент."""
+        tags = [tag.id for tag in self.tags]
+
+        def count_queries(ingredients):
+            payload = self.payload(
+                [(ingredient.id, 1) for ingredient in ingredients], tags
+            )
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.post(
+                    '/api/recipes/', payload, format='json'
+                )
+            self.assertEqual(response.status_code, HTTPStatus.CREATED)
+            return len(context.captured_queries)
+
+        self.assertEqual(
+            count_queries(self.ingredients[:1]),
+            count_queries(self.ingredients)
+        )
+
+    def test_update_query_count(self):
+        """Число запросов при обновлении не зависит от размера состава."""
+        tags = [self.tags[0].id]
+
+        def count_queries(old, new):
+            response = self.client.post('/api/recipes/', self.payload(
+                [(ingredient.id, 1) for ingredient in old], tags
+            ), format='json')
+            payload = self.payload(
+                [(ingredient.id, 1) for ingredient in new], tags
+            )
+            del payload['image']
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.patch(
+                    f'/api/recipes/{response.data["id"]}/', payload,
+                    format='json'
+                )
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            self.assertEqual(
+                Recipe.objects.get(pk=response.data['id']).ingredients_count,
+                len(new)
+            )
+            return len(context.captured_queries)
+
+        self.assertEqual(
+            count_queries(self.ingredients[:1], self.ingredients[1:2]),
+            count_queries(self.ingredients[:2], self.ingredients[2:4])
+        )
+
+    def test_update_applies_diff(self):
+        """При обновлении меняются только изменившиеся ингредиенты."""
+        first, second, third = self.ingredients[:3]
+        response = self.client.post('/api/recipes/', self.payload(
+            [(first.id, 1), (second.id, 2)], [self.tags[0].id]
+        ), format='json')
+        recipe_id = response.data['id']
+        self.assertEqual(
+            Recipe.objects.get(pk=recipe_id).ingredients_count, 2
+        )
+        kept = IngredientRecipe.objects.get(
+            recipe_id=recipe_id, ingredient=first
+        )
+        payload = self.payload(
+            [(first.id, 1), (second.id, 5), (third.id, 3)],
+            [self.tags[1].id]
+        )
+        del payload['image']
+        response = self.client.patch(
+            f'/api/recipes/{recipe_id}/', payload, format='json'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertTrue(IngredientRecipe.objects.filter(pk=kept.pk).exists())
+        self.assertEqual(
+            Recipe.objects.get(pk=recipe_id).ingredients_count, 3
+        )
+        self.assertEqual(
+            sorted(
+                (item['id'], item['amount'])
+                for item in response.data['ingredients']
+            ),
+            [(first.id, 1), (second.id, 5), (third.id, 3)]
+        )
+        self.assertEqual(
+            [tag['id'] for tag in response.data['tags']], [self.tags[1].id]
+        )
+
+
+class ResponseCacheTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(
+            username='chef',
+            email='chef@example.com',
+            password='testpass123'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.user,
+            name='Рецепт',
+            text='Описание',
+            cooking_time=10
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_anonymous_list_is_cached(self):
+        """Повторный анонимный запрос отдаётся из кеша с ETag."""
+        response = self.client.get('/api/recipes/?limit=6&page=1')
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/recipes/?page=1&limit=6')
+        self.assertEqual(response['ETag'], etag)
+        response = self.client.get(
+            f'/api/recipes/{self.recipe.id}/', HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        response = self.client.get(
+            '/api/recipes/?limit=6&page=1', HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_cache_key_includes_scheme(self):
+        """Абсолютные ссылки пагинации не отдаются по чужой схеме."""
+        Recipe.objects.create(
+            author=self.user, name='Второй', text='Описание', cooking_time=5
+        )
+        url = '/api/recipes/?limit=1'
+        self.assertTrue(self.client.get(url).data['next'].startswith(
+            'http://'
+        ))
+        response = self.client.get(url, secure=True)
+        self.assertTrue(response.data['next'].startswith('https://'))
+
+    def test_cache_invalidated_on_recipe_change(self):
+        self.client.get(f'/api/recipes/{self.recipe.id}/')
+        self.recipe.name = 'Новое название'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.save()
+        response = self.client.get(f'/api/recipes/{self.recipe.id}/')
+        self.assertEqual(response.data['name'], 'Новое название')
+
+
+class CounterTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(
+            username='chef',
+            email='chef@example.com',
+            password='testpass123'
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.user,
+                name=f'Рецепт {index}',
+                text='Описание',
+                cooking_time=10
+            )
+            for index in range(2)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_counters_follow_writes(self):
+        recipe = self.recipes[0]
+        url = f'/api/recipes/{recipe.id}/favorite/'
+        self.client.post(url)
+        self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(recipe.shopping_cart_count, 1)
+        self.client.delete(url)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 0)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.recipes_count, 2)
+
+    def test_ingredients_count_follows_rows(self):
+        recipe = self.recipes[0]
+        salt, pepper = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('соль', 'перец')
+        ]
+        for ingredient in (salt, pepper):
+            IngredientRecipe.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=1
+            )
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.ingredients_count, 2)
+        recipe.recipe_ingredients.get(ingredient=salt).delete()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.ingredients_count, 1)
+
+    def test_save_does_not_overwrite_counters(self):
+        recipe = Recipe.objects.get(pk=self.recipes[0].pk)
+        Favorite.objects.create(user=self.user, recipe=recipe)
+        recipe.name = 'Новое название'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+
+    def test_popular_ordering(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipes[0])
+        response = self.client.get('/api/recipes/?ordering=-favorites_count')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [self.recipes[0].id, self.recipes[1].id]
+        )
+        self.assertEqual(response.data['results'][0]['favorites_count'], 1)
+
+    def test_reconcile_counters(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipes[0])
+        Recipe.objects.update(favorites_count=5)
+        get_user_model().objects.update(recipes_count=0)
+        call_command('reconcile_counters', stdout=io.StringIO())
+        self.assertEqual(
+            list(Recipe.objects.order_by('id').values_list(
+                'favorites_count', flat=True
+            )),
+            [1, 0]
+        )
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.recipes_count, 2)
+
+    def test_toggle_statuses(self):
+        url = f'/api/recipes/{self.recipes[0].id}/favorite/'
+        self.assertEqual(self.client.post(url).status_code, HTTPStatus.CREATED)
+        self.assertEqual(
+            self.client.post(url).status_code, HTTPStatus.BAD_REQUEST
+        )
+        self.assertEqual(
+            self.client.delete(url).status_code, HTTPStatus.NO_CONTENT
+        )
+        self.assertEqual(
+            self.client.delete(url).status_code, HTTPStatus.BAD_REQUEST
+        )
+        self.assertFalse(Favorite.objects.exists())
+        self.recipes[0].refresh_from_db()
+        self.assertEqual(self.recipes[0].favorites_count, 0)
+
+    def test_duplicate_relation_rejected(self):
+        Subscription.objects.create(user=self.user, author=self.user)
+        with self.assertRaises(IntegrityError):
+            Subscription.objects.create(user=self.user, author=self.user)
+
+    def test_bulk_shopping_cart(self):
+        url = '/api/recipes/shopping_cart/'
+        ids = [recipe.id for recipe in self.recipes]
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipes[0])
+        response = self.client.post(url, {'recipes': ids}, format='json')
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data], [ids[1]]
+        )
+        self.assertEqual(
+            list(Recipe.objects.order_by('id').values_list(
+                'shopping_cart_count', flat=True
+            )),
+            [1, 1]
+        )
+        response = self.client.post(url, {'recipes': ids}, format='json')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        response = self.client.post(url, {'recipes': [0]}, format='json')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        response = self.client.delete(
+            url, {'recipes': ids[:1]}, format='json'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+        response = self.client.delete(
+            url, {'recipes': ids[:1]}, format='json'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.client.delete(f'{url}clear/')
+        self.assertFalse(ShoppingCart.objects.exists())
+        self.assertEqual(
+            set(Recipe.objects.values_list('shopping_cart_count', flat=True)),
+            {0}
+        )
+
+
+class ShortLinkTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='chef',
+            email='chef@example.com',
+            password='testpass123'
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def create_recipe(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Recipe.objects.create(
+                author=self.user,
+                name='Рецепт',
+                text='Описание',
+                cooking_time=10
+            )
+
+    def test_redirect_served_from_cache(self):
+        recipe = self.create_recipe()
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/s/{recipe.short_url}/')
+        self.assertRedirects(
+            response, f'/recipes/{recipe.id}',
+            fetch_redirect_response=False
+        )
+
+    def test_missing_code_cached(self):
+        self.assertEqual(
+            self.client.get('/s/missing1/').status_code, HTTPStatus.NOT_FOUND
+        )
+        with self.assertNumQueries(0):
+            self.client.get('/s/missing1/')
+
+    def test_code_collision_retried(self):
+        taken = self.create_recipe().short_url
+        codes = iter([taken, 'freecode'])
+        with mock.patch.object(
+            Recipe, '_generate_short_code', side_effect=lambda: next(codes)
+        ):
+            recipe = self.create_recipe()
+        self.assertEqual(recipe.short_url, 'freecode')
+
+
+urlpatterns = async_views.urlpatterns + project_urls.urlpatterns
+
+
+@override_settings(ROOT_URLCONF='foodgram.tests')
+class AsyncViewsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user(
+            username='reader',
+            email='reader@example.com',
+            password='testpass123'
+        )
+        cls.token = Token.objects.create(user=cls.user)
+        cls.author = User.objects.create_user(
+            username='chef',
+            email='chef@example.com',
+            password='testpass123'
+        )
+        cls.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        ingredient = Ingredient.objects.create(
+            name='Мука', measurement_unit='г'
+        )
+        cls.recipes = []
+        for index in range(3):
+            recipe = Recipe.objects.create(
+                author=cls.author,
+                name=f'Рецепт {index}',
+                text='Описание',
+                cooking_time=10
+            )
+            recipe.tags.add(cls.tag)
+            IngredientRecipe.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=100
+            )
+            cls.recipes.append(recipe)
+        Favorite.objects.create(user=cls.user, recipe=cls.recipes[0])
+        Subscription.objects.create(user=cls.user, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    async def assertSameAsSync(self, url, headers=None):
+        response = await self.async_client.get(url, headers=headers)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        await cache.aclear()
+        with self.settings(ROOT_URLCONF='foodgram_backend.urls'):
+            expected = await self.async_client.get(url, headers=headers)
+        self.assertEqual(response.json(), expected.json())
+        return response
+
+    async def test_recipes_match_sync_views(self):
+        auth = {'Authorization': f'Token {self.token.key}'}
+        for headers in (None, auth):
+            await self.assertSameAsSync(
+                '/api/recipes/?limit=2&page=2&tags=breakfast', headers
+            )
+            await self.assertSameAsSync(
+                f'/api/recipes/{self.recipes[0].id}/', headers
+            )
+        response = await self.async_client.get(
+            f'/api/recipes/{self.recipes[0].id}/', headers=auth
+        )
+        data = response.json()
+        self.assertTrue(data['is_favorited'])
+        self.assertTrue(data['author']['is_subscribed'])
+
+    async def test_cold_tag_catalog(self):
+        """Справочник тегов не загружается в цикле событий."""
+        for url in (
+            f'/api/recipes/{self.recipes[0].id}/', '/api/recipes/'
+        ):
+            with self.subTest(url=url):
+                tag_catalog.index = None
+                response = await self.async_client.get(url)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    async def test_reference_endpoints(self):
+        await self.assertSameAsSync('/api/tags/')
+        await self.assertSameAsSync('/api/ingredients/?name=му')
+        response = await self.async_client.get(
+            f'/s/{self.recipes[0].short_url}/'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+
+    async def test_delegates_to_sync_views(self):
+        response = await self.async_client.post('/api/recipes/', {})
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+        response = await self.async_client.get(
+            '/api/recipes/', headers={'Authorization': 'Token invalid'}
+        )
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+        response = await self.async_client.get('/api/recipes/?cursor=')
+        self.assertNotIn('count', response.json())
+
+
+class RecipeSearchTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='cook', email='cook@example.com', password='pass'
+        )
+        cls.cottage_cheese = Ingredient.objects.create(
+            name='творог', measurement_unit='г'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def create_recipe(self, name, text, ingredients=()):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                author=self.user, name=name, text=text, cooking_time=10
+            )
+            IngredientRecipe.objects.bulk_create([
+                IngredientRecipe(
+                    recipe=recipe, ingredient=ingredient, amount=100
+                )
+                for ingredient in ingredients
+            ])
+        return recipe
+
+    def search(self, query, **params):
+        response = self.client.get(
+            '/api/recipes/', {'search': query, **params}
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_ranked_search(self):
+        """Совпадение в названии выше совпадения в описании."""
+        in_text = self.create_recipe(
+            'Завтрак', 'Подавать как сырники со сметаной'
+        )
+        in_name = self.create_recipe('Сырники', 'Жарить на сковороде')
+        in_ingredients = self.create_recipe(
+            'Запеканка', 'Запекать в духовке', [self.cottage_cheese]
+        )
+        self.create_recipe('Борщ', 'Варить два часа')
+        self.assertEqual(self.search('сырники'), [in_name.id, in_text.id])
+        self.assertEqual(self.search('творог'), [in_ingredients.id])
+        self.assertEqual(
+            self.search('сырники', ordering='pub_date'),
+            [in_text.id, in_name.id]
+        )
+        self.assertEqual(self.search('пельмени'), [])
+
+    def test_incremental_update(self):
+        recipe = self.create_recipe('Салат', 'Нарезать')
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.name = 'Винегрет'
+            recipe.save()
+        self.assertEqual(self.search('винегрет'), [recipe.id])
+        ingredient = Ingredient.objects.create(
+            name='свекла', measurement_unit='г'
+        )
+        IngredientRecipe.objects.create(
+            recipe=recipe, ingredient=ingredient, amount=1
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            ingredient.name = 'свёкла'
+            ingredient.save()
+        self.assertEqual(self.search('свёкла'), [recipe.id])
+
+    def test_composition_update(self):
+        """Состав без сохранения рецепта тоже попадает в поиск."""
+        recipe = self.create_recipe('Салат', 'Нарезать')
+        carrot, beet = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('морковь', 'свекла')
+        ]
+        with self.captureOnCommitCallbacks() as callbacks:
+            for ingredient in (carrot, beet):
+                IngredientRecipe.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=1
+                )
+        # Обе строки состава пересчитывают рецепт одним обновлением.
+        with CaptureQueriesContext(connection) as context:
+            for callback in callbacks:
+                callback()
+        self.assertEqual(
+            sum('UPDATE' in query['sql'] for query in context), 1
+        )
+        self.assertEqual(self.search('морковь'), [recipe.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.recipe_ingredients.get(ingredient=carrot).delete()
+        self.assertEqual(self.search('морковь'), [])
+        self.assertEqual(self.search('свекла'), [recipe.id])
+
+
+class IngredientMatchTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='cook', email='cook@example.com', password='pass'
+        )
+        cls.eggs, cls.milk, cls.flour, cls.salt = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('яйца', 'молоко', 'мука', 'соль')
+        ]
+        cls.omelette = cls.create_recipe('Омлет', cls.eggs, cls.milk)
+        cls.pancakes = cls.create_recipe(
+            'Блины', cls.eggs, cls.milk, cls.flour
+        )
+        cls.bread = cls.create_recipe('Хлеб', cls.flour, cls.salt)
+
+    @classmethod
+    def create_recipe(cls, name, *ingredients):
+        recipe = Recipe.objects.create(
+            author=cls.user, name=name, text='Текст', cooking_time=10,
+            ingredients_count=len(ingredients)
+        )
+        IngredientRecipe.objects.bulk_create([
+            IngredientRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in ingredients
+        ])
+        return recipe
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def match(self, query):
+        return self.client.get(f'/api/recipes/match/?{query}')
+
+    def test_ranked_by_coverage(self):
+        response = self.match(
+            f'ingredients={self.eggs.id},{self.milk.id}'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        results = response.data['results']
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(
+            [(recipe['id'], recipe['coverage']) for recipe in results],
+            [(self.omelette.id, 1), (self.pancakes.id, 2 / 3)]
+        )
+        self.assertEqual(results[0]['missing_ingredients'], [])
+        self.assertEqual(
+            [item['id'] for item in results[1]['missing_ingredients']],
+            [self.flour.id]
+        )
+
+    def test_min_coverage_and_filters(self):
+        ingredients = (
+            f'ingredients={self.eggs.id}&ingredients={self.flour.id}'
+        )
+        response = self.match(f'{ingredients}&min_coverage=0.6')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [self.pancakes.id]
+        )
+        other = get_user_model().objects.create_user(
+            username='other', email='other@example.com', password='pass'
+        )
+        response = self.match(f'{ingredients}&author={other.id}')
+        self.assertEqual(response.data['results'], [])
+
+    def test_invalid_params(self):
+        for query in ('', 'ingredients=abc', 'ingredients=1&min_coverage=2'):
+            with self.subTest(query=query):
+                self.assertEqual(
+                    self.match(query).status_code, HTTPStatus.BAD_REQUEST
+                )
+
+    def test_query_count(self):
+        tag_catalog.get_index()
+        # COUNT, страница с покрытием, теги, состав и подписки.
+        with self.assertNumQueries(5):
+            self.match(f'ingredients={self.eggs.id}')
+
+
+class FeedTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.reader, cls.author, cls.other = [
+            User.objects.create_user(
+                username=name, email=f'{name}@example.com', password='pass'
+            )
+            for name in ('reader', 'author', 'other')
+        ]
+        cls.recipes = [
+            Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Текст',
+                cooking_time=10
+            )
+            for number, author in enumerate(
+                [cls.author, cls.other, cls.author, cls.author]
+            )
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.reader)
+
+    def read_feed(self):
+        ids = []
+        url = '/api/recipes/feed/?cursor=&limit=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            ids += [recipe['id'] for recipe in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_strategies_match(self):
+        Subscription.objects.add(self.reader, self.author)
+        call_command('rebuild_feed', stdout=io.StringIO())
+        expected = [recipe.id for recipe in self.recipes[::-1]
+                    if recipe.author == self.author]
+        for strategy in ('read', 'write'):
+            with self.subTest(strategy=strategy), \
+                    override_settings(FEED_STRATEGY=strategy):
+                self.assertEqual(self.read_feed(), expected)
+
+    @override_settings(FEED_STRATEGY='write')
+    def test_fan_out_on_write(self):
+        url = f'/api/users/{self.other.id}/subscribe/'
+        self.client.post(url)
+        self.assertEqual(self.read_feed(), [self.recipes[1].id])
+        recipe = Recipe.objects.create(
+            author=self.other, name='Новый', text='Текст', cooking_time=5
+        )
+        self.assertEqual(self.read_feed(), [recipe.id, self.recipes[1].id])
+        self.client.delete(url)
+        self.assertEqual(self.read_feed(), [])
+        self.assertFalse(FeedEntry.objects.exists())
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(user=None)
+        response = self.client.get('/api/recipes/feed/')
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+
+
+class TagCatalogTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='tagger', email='tagger@example.com', password='pass'
+        )
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {index}', slug=f'tag-{index}')
+            for index in range(2)
+        ]
+        recipe = Recipe.objects.create(
+            author=cls.user, name='Рецепт', text='Описание', cooking_time=5
+        )
+        recipe.tags.set(cls.tags)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_conditional_get(self):
+        """Теги отдаются из памяти с сильным ETag и 304 на повтор."""
+        self.client.get('/api/tags/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/tags/')
+        self.assertEqual(len(response.json()), 2)
+        etag = response['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        self.assertIn('max-age', response['Cache-Control'])
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        response = self.client.get(f'/api/tags/{self.tags[0].id}/')
+        self.assertEqual(response.json()['slug'], 'tag-0')
+        self.assertEqual(response['ETag'], etag)
+        response = self.client.get('/api/tags/0/')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_invalidation(self):
+        etag = self.client.get('/api/tags/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Новый', slug='new')
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(len(response.json()), 3)
+
+    def test_snapshot_expires(self):
+        """Изменение, не дошедшее через кеш, видно по истечении срока."""
+        index = tag_catalog.get_index()
+        Tag.objects.filter(pk=self.tags[0].pk).update(name='Другой')
+        self.assertIs(tag_catalog.get_index(), index)
+        with mock.patch(
+            'foodgram.tag_catalog.time.monotonic',
+            return_value=index.loaded_at
+            + constants.TAG_CATALOG_SNAPSHOT_TTL + 1
+        ):
+            fresh = tag_catalog.get_index()
+        self.assertEqual(fresh.by_id[self.tags[0].pk].name, 'Другой')
+        self.assertNotEqual(fresh.etag, index.etag)
+
+    def test_recipe_tags_from_catalog(self):
+        """Теги рецепта не читаются из таблицы тегов."""
+        self.client.get('/api/tags/')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/recipes/')
+        self.assertEqual(
+            response.json()['results'][0]['tags'],
+            [
+                {'id': tag.id, 'name': tag.name, 'slug': tag.slug}
+                for tag in self.tags
+            ]
+        )
+        self.assertFalse(any(
+            'FROM "foodgram_tag"' in query['sql']
+            for query in context.captured_queries
+        ))
+
+
+class MetricsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = get_user_model().objects.create_user(
+            username='admin', email='admin@example.com', password='pass',
+            is_staff=True
+        )
+        for index in range(3):
+            Tag.objects.create(name=f'Тег {index}', slug=f'tag-{index}')
+
+    SERVER_TIMING = (
+        r'^db;dur=[\d.]+;desc="\d+ queries", serializer;dur=[\d.]+, '
+        r'total;dur=[\d.]+$'
+    )
+
+    def test_server_timing(self):
+        """Заголовок Server-Timing видят только сотрудники и при DEBUG."""
+        self.assertNotIn('Server-Timing', self.client.get('/api/recipes/'))
+        with override_settings(DEBUG=True):
+            response = self.client.get('/api/recipes/')
+        self.assertRegex(response['Server-Timing'], self.SERVER_TIMING)
+        client = APIClient()
+        client.force_authenticate(user=self.staff)
+        response = client.get('/api/recipes/')
+        self.assertRegex(response['Server-Timing'], self.SERVER_TIMING)
+
+    async def test_server_timing_async(self):
+        response = await self.async_client.get('/api/recipes/')
+        self.assertNotIn('Server-Timing', response)
+        token = await Token.objects.acreate(user=self.staff)
+        response = await self.async_client.get(
+            '/api/recipes/', AUTHORIZATION=f'Token {token.key}'
+        )
+        self.assertRegex(response['Server-Timing'], self.SERVER_TIMING)
+
+    @override_settings(SLOW_REQUEST_THRESHOLD=1)
+    def test_slow_request_log(self):
+        with mock.patch('foodgram.instrumentation.time.perf_counter') as clock:
+            clock.side_effect = itertools.count(step=0.5)
+            with self.assertLogs('foodgram.slow_requests') as logs:
+                self.client.get('/api/users/')
+        self.assertIn('api/users/', logs.output[0])
+        self.assertIn('1 x SELECT', logs.output[0])
+
+    def test_metrics_endpoint(self):
+        self.client.get('/api/tags/')
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        body = response.content.decode()
+        self.assertIn('# TYPE foodgram_requests_total counter', body)
+        self.assertRegex(body, r'\nfoodgram_requests_total \d+')
+        self.assertRegex(
+            body,
+            r'foodgram_view_db_queries_sum\{method="GET",view="tags-list"\} '
+            r'\d+'
+        )
+
+
+class BenchmarkTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = benchmarks.generate_data(
+            users=6, recipes=20, ingredients=30, favorites=3,
+            shopping_cart=3, subscriptions=2
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_generated_data(self):
+        self.assertEqual(Recipe.objects.count(), 21)
+        self.assertEqual(Favorite.objects.count(), 18)
+        self.assertFalse(
+            Subscription.objects.filter(user=F('author')).exists()
+        )
+        recipe = Recipe.objects.filter(favorites_count__gt=0).first()
+        self.assertEqual(
+            recipe.favorites_count, recipe.favorited_by.count()
+        )
+
+    def test_query_budgets(self):
+        """Сценарии замеров укладываются в бюджет SQL-запросов."""
+        for scenario in benchmarks.SCENARIOS:
+            with self.subTest(scenario=scenario.name):
+                result = benchmarks.run_scenario(scenario, self.data, 1)
+                self.assertLessEqual(result['queries'], scenario.budget)
@@ -1,34 +1,68 @@
-from django.db.models import Sum
-from django.http import HttpResponse
-from django.shortcuts import get_object_or_404, redirect
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Prefetch
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import redirect
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.serializers import SetPasswordSerializer
-from rest_framework import exceptions, filters, status, viewsets
+from rest_framework import exceptions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
-from foodgram.filters import RecipeFilter
+from foodgram.caching import RECIPES_VERSION_KEY, CachedResponseMixin
+from foodgram.feed import get_feed
+from foodgram.filters import IngredientSearchFilter, RecipeFilter
+from foodgram.ingredient_match import match_recipes
+from foodgram.ingredient_search import catalog
+from foodgram.metrics import registry
 from foodgram.models import (Favorite, Ingredient, Recipe, ShoppingCart,
                              Subscription, Tag, User)
-from foodgram.paginations import FoodgramPagination
+from foodgram.negotiations import IgnoreFormatContentNegotiation
+from foodgram.paginations import (FoodgramPagination, KeysetPagination,
+                                  KeysetPaginationMixin,
+                                  SubscriptionKeysetPagination)
 from foodgram.permissions import IsAuthorOrReadOnly
-from foodgram.serializers import (AvatarSerializer, IngredientSerializer,
-                                  RecipeSerializer, ShortRecipeSerializer,
+from foodgram.serializers import (AvatarSerializer, IngredientMatchSerializer,
+                                  IngredientSerializer, RecipeIdsSerializer,
+                                  RecipeMatchSerializer, RecipeSerializer,
+                                  ShortRecipeSerializer,
                                   SubscriptionSerializer, TagSerializer,
                                   UserSerializer)
+from foodgram.shopping_list import EXPORT_FORMATS, get_shopping_list
+from foodgram.short_links import resolve_short_code
+from foodgram.tag_catalog import catalog as tag_catalog
+from foodgram.tag_catalog import finalize_catalog_response
 
 
 def short_url_redirect(request, code):
-    recipe = get_object_or_404(Recipe, short_url=code)
-    return redirect(f'/recipes/{recipe.id}')
+    recipe_id = resolve_short_code(code)
+    if recipe_id is None:
+        raise Http404
+    return redirect(f'/recipes/{recipe_id}')
 
 
-class UserViewSet(viewsets.ModelViewSet):
+def metrics(request):
+    return HttpResponse(
+        registry.render(), content_type='text/plain; version=0.0.4'
+    )
+
+
+class UserViewSet(KeysetPaginationMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     pagination_class = FoodgramPagination
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if user.is_authenticated:
+            queryset = queryset.annotate(
+                is_subscribed=Exists(Subscription.objects.filter(
+                    user=user, author=OuterRef('pk')
+                ))
+            )
+        return queryset
+
     def create(self, request, *args, **kwargs):
         """При POST-запросе пароль хешируется и сохраняется."""
         serializer = self.get_serializer(data=request.data)
@@ -67,9 +101,10 @@ class UserViewSet(viewsets.ModelViewSet):
             )
         if request.method == 'DELETE':
             if user.avatar:
-                user.avatar.delete()
+                # Файл назван по хешу содержимого и может принадлежать
+                # другим пользователям, поэтому очищается только поле.
                 user.avatar = None
-                user.save()
+                user.save(update_fields=['avatar'])
                 return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -87,12 +122,13 @@ class UserViewSet(viewsets.ModelViewSet):
                     {'errors': 'Нельзя подписаться на себя'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            if Subscription.objects.filter(user=user, author=author).exists():
+            if not Subscription.objects.add(user, author):
                 return Response(
                     {'errors': 'Вы уже подписаны на этого автора'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            Subscription.objects.create(user=user, author=author)
+            # Аннотация из get_queryset вычислена до подписки.
+            author.is_subscribed = True
             serializer = SubscriptionSerializer(
                 author,
                 context={'request': request}
@@ -100,22 +136,31 @@ class UserViewSet(viewsets.ModelViewSet):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         if request.method == 'DELETE':
-            obj = Subscription.objects.filter(user=user, author=author)
-            if not obj.exists():
+            if not Subscription.objects.remove(user, author):
                 return Response(
                     {'errors': 'Вы не подписаны на этого автора'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            obj.delete()
             return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
         detail=False,
         methods=['get'],
-        permission_classes=[IsAuthenticated]
+        permission_classes=[IsAuthenticated],
+        keyset_pagination_class=SubscriptionKeysetPagination
     )
     def subscriptions(self, request):
-        authors = User.objects.filter(following__user=request.user)
+        recipes = Recipe.objects.all()
+        recipes_limit = request.query_params.get('recipes_limit', '')
+        if recipes_limit.isdigit():
+            recipes = recipes[:int(recipes_limit)]
+        authors = User.objects.filter(
+            Exists(Subscription.objects.filter(
+                user=request.user, author=OuterRef('pk')
+            ))
+        ).prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='latest_recipes')
+        )
         page = self.paginate_queryset(authors)
         serializer = SubscriptionSerializer(
             page,
@@ -142,24 +187,112 @@ class UserViewSet(viewsets.ModelViewSet):
 
 
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
+    """Теги отдаются из справочника в памяти без запросов к базе."""
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        index = tag_catalog.get_index()
+        return finalize_catalog_response(
+            request, Response(index.data), index
+        )
 
-class RecipeViewSet(viewsets.ModelViewSet):
+    def retrieve(self, request, *args, **kwargs):
+        index = tag_catalog.get_index()
+        try:
+            data = index.data_by_id[int(kwargs['pk'])]
+        except (KeyError, ValueError):
+            raise Http404
+        return finalize_catalog_response(request, Response(data), index)
+
+
+class RecipeViewSet(
+    KeysetPaginationMixin, CachedResponseMixin, viewsets.ModelViewSet
+):
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     pagination_class = FoodgramPagination
     permission_classes = [IsAuthorOrReadOnly]
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
+    cache_version_key = RECIPES_VERSION_KEY
+    keyset_pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve', 'match', 'feed'):
+            queryset = queryset.with_related().with_user_flags(
+                self.request.user
+            )
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['list_thumbnails'] = self.action in ('list', 'feed', 'match')
+        return context
 
     def get_serializer_class(self):
         if self.action == 'update':
             raise exceptions.MethodNotAllowed('PUT')
         return super().get_serializer_class()
 
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[IsAuthenticated]
+    )
+    def feed(self, request):
+        """Рецепты авторов из подписок, от новых к старым.
+
+        Всегда с пагинацией по курсору: первая страница — ?cursor=,
+        следующие — по ссылке next. Фильтры списка рецептов применяются.
+        """
+        queryset, paginator = get_feed(
+            self.filter_queryset(self.get_queryset()), request.user
+        )
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=['get'],
+        keyset_pagination_class=None
+    )
+    def match(self, request):
+        """Рецепты, которые можно приготовить из имеющихся ингредиентов.
+
+        ?ingredients=1,2,3 — id ингредиентов, ?min_coverage=0.5 — нижняя
+        граница покрытия. Остальные фильтры списка рецептов тоже
+        применяются, а порядок задаётся покрытием.
+        """
+        params = IngredientMatchSerializer(data={
+            'ingredients': [
+                value
+                for item in request.query_params.getlist('ingredients')
+                for value in item.split(',') if value
+            ],
+            'min_coverage': request.query_params.get('min_coverage', 0),
+        })
+        params.is_valid(raise_exception=True)
+        available = set(params.validated_data['ingredients'])
+        queryset = match_recipes(
+            self.filter_queryset(self.get_queryset()),
+            available,
+            params.validated_data['min_coverage']
+        )
+        page = self.paginate_queryset(queryset)
+        serializer = RecipeMatchSerializer(
+            page,
+            many=True,
+            context={
+                **self.get_serializer_context(),
+                'available_ingredients': available,
+            }
+        )
+        return self.get_paginated_response(serializer.data)
+
     @action(
         detail=True,
         methods=['get'],
@@ -179,48 +312,102 @@ class RecipeViewSet(viewsets.ModelViewSet):
         user = request.user
 
         if request.method == 'POST':
-            if ShoppingCart.objects.filter(user=user, recipe=recipe).exists():
+            if not ShoppingCart.objects.add(user, recipe):
                 return Response(
                     {'errors': 'Рецепт уже в списке покупок'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            ShoppingCart.objects.create(user=user, recipe=recipe)
             serializer = ShortRecipeSerializer(recipe)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         if request.method == 'DELETE':
-            obj = ShoppingCart.objects.filter(user=user, recipe=recipe)
-            if not obj.exists():
+            if not ShoppingCart.objects.remove(user, recipe):
                 return Response(
                     {'errors': 'Рецепта нет в списке покупок'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            obj.delete()
             return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def bulk_relation(self, request, model):
+        """Добавляет или удаляет сразу несколько рецептов.
+
+        POST возвращает только добавленные рецепты, DELETE — 204. Если
+        список не изменился, оба метода отвечают 400.
+        """
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipes = serializer.validated_data['recipes']
+        recipe_ids = [recipe.id for recipe in recipes]
+        if request.method == 'POST':
+            added = set(model.objects.add_many(request.user, recipe_ids))
+            if not added:
+                return Response(
+                    {'errors': 'Все рецепты уже в списке'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            return Response(
+                ShortRecipeSerializer(
+                    [recipe for recipe in recipes if recipe.id in added],
+                    many=True
+                ).data,
+                status=status.HTTP_201_CREATED
+            )
+        if not model.objects.remove_many(request.user, recipe_ids):
+            return Response(
+                {'errors': 'Ни одного из рецептов нет в списке'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated],
+        url_path='shopping_cart',
+        url_name='bulk-shopping-cart'
+    )
+    def bulk_shopping_cart(self, request):
+        return self.bulk_relation(request, ShoppingCart)
+
+    @action(
+        detail=False,
+        methods=['delete'],
+        permission_classes=[IsAuthenticated],
+        url_path='shopping_cart/clear'
+    )
+    def clear_shopping_cart(self, request):
+        ShoppingCart.objects.remove_many(request.user)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated],
+        url_path='favorite',
+        url_name='bulk-favorite'
+    )
+    def bulk_favorite(self, request):
+        return self.bulk_relation(request, Favorite)
+
     @action(
         detail=False,
         methods=['get'],
-        permission_classes=[IsAuthenticated]
+        permission_classes=[IsAuthenticated],
+        content_negotiation_class=IgnoreFormatContentNegotiation
     )
     def download_shopping_cart(self, request):
-        ingredients = Ingredient.objects.filter(
-            ingredientrecipe__recipe__in_shopping_carts__user=request.user
-        ).annotate(
-            total_amount=Sum('ingredientrecipe__amount')
-        ).order_by('name')
-        shop_list = ['Список покупок:\n\n']
-        for ingredient in ingredients:
-            shop_list.append(
-                f'{ingredient.name} - '
-                f'{ingredient.total_amount} '
-                f'{ingredient.measurement_unit}\n'
+        file_format = request.query_params.get('format', 'txt')
+        if file_format not in EXPORT_FORMATS:
+            return Response(
+                {'errors': f'Неизвестный формат файла: {file_format}'},
+                status=status.HTTP_400_BAD_REQUEST
             )
-        shop_list = ''.join(shop_list)
-        file_name = 'shop_list.txt'
-        response = HttpResponse(
-            shop_list, content_type='text/plain; charset=utf-8'
+        render, content_type = EXPORT_FORMATS[file_format]
+        response = StreamingHttpResponse(
+            render(get_shopping_list(request.user)),
+            content_type=content_type
         )
+        file_name = f'shop_list.{file_format}'
         response['Content-Disposition'] = f'attachment; filename={file_name}'
         return response
 
@@ -234,23 +421,20 @@ class RecipeViewSet(viewsets.ModelViewSet):
         user = request.user
 
         if request.method == 'POST':
-            if Favorite.objects.filter(user=user, recipe=recipe).exists():
+            if not Favorite.objects.add(user, recipe):
                 return Response(
                     {'errors': 'Рецепт уже в избранном'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            Favorite.objects.create(user=user, recipe=recipe)
             serializer = ShortRecipeSerializer(recipe)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         if request.method == 'DELETE':
-            obj = Favorite.objects.filter(user=user, recipe=recipe)
-            if not obj.exists():
+            if not Favorite.objects.remove(user, recipe):
                 return Response(
                     {'errors': 'Рецепта нет в избранном'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            obj.delete()
             return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -258,6 +442,17 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = IngredientSerializer
     queryset = Ingredient.objects.all()
     pagination_class = None
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['^name']
-    search_param = 'name'
+    filter_backends = [IngredientSearchFilter]
+
+    def get_queryset(self):
+        if settings.INGREDIENT_CATALOG_IN_MEMORY:
+            return catalog.get_index().items
+        return super().get_queryset()
+
+    def get_object(self):
+        if not settings.INGREDIENT_CATALOG_IN_MEMORY:
+            return super().get_object()
+        try:
+            return catalog.get_index().by_id[int(self.kwargs['pk'])]
+        except (KeyError, ValueError):
+            raise Http404
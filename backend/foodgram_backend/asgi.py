@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram_backend.settings')
 
 application = get_asgi_application()
+
+from foodgram.ingredient_search import catalog  # noqa: E402
+
+catalog.warm_up()
@@ -1,6 +1,8 @@
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = os.getenv('SECRET_KEY', default='key')
@@ -16,6 +18,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'django_filters',
     'djoser',
     'corsheaders',
@@ -25,6 +28,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram.instrumentation.instrumentation_middleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -63,6 +67,14 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'foodgram_backend.wsgi.application'
 
+# За PgBouncer в режиме transaction нельзя использовать серверные курсоры
+# и параметры запуска соединения: statement_timeout тогда задаётся
+# для роли через ALTER ROLE ... SET statement_timeout.
+DB_PGBOUNCER = os.getenv('DB_PGBOUNCER', 'False').lower() == 'true'
+DB_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT', 0))
+
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'False').lower() == 'true'
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -70,10 +82,82 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', 'food'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', 'food_password'),
         'HOST': os.getenv('DB_HOST', 'localhost'),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        # Под ASGI соединения не переиспользуются между запросами и
+        # простаивают в потоках, поэтому там по умолчанию 0 и PgBouncer.
+        'CONN_MAX_AGE': int(
+            os.getenv('DB_CONN_MAX_AGE', 0 if ASYNC_READ_VIEWS else 60)
+        ),
+        'CONN_HEALTH_CHECKS': (
+            os.getenv('DB_CONN_HEALTH_CHECKS', 'True').lower() == 'true'
+        ),
+        'DISABLE_SERVER_SIDE_CURSORS': DB_PGBOUNCER,
+        'OPTIONS': {
+            'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', 5)),
+        },
     }
 }
 
+if DB_STATEMENT_TIMEOUT and not DB_PGBOUNCER:
+    DATABASES['default']['OPTIONS']['options'] = (
+        f'-c statement_timeout={DB_STATEMENT_TIMEOUT}'
+    )
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+INGREDIENT_SEARCH_FUZZY = (
+    os.getenv('INGREDIENT_SEARCH_FUZZY', 'False').lower() == 'true'
+)
+
+INGREDIENT_CATALOG_IN_MEMORY = (
+    os.getenv('INGREDIENT_CATALOG_IN_MEMORY', 'False').lower() == 'true'
+)
+
+# Конфигурация текстового поиска PostgreSQL для ?search= у рецептов.
+RECIPE_SEARCH_CONFIG = os.getenv('RECIPE_SEARCH_CONFIG', 'russian')
+
+# Лента подписок: read — выборка рецептов авторов при каждом запросе,
+# write — лента каждого подписчика материализуется в FeedEntry
+# при публикации рецепта. После смены на write выполните rebuild_feed.
+FEED_STRATEGY = os.getenv('FEED_STRATEGY', 'read')
+
+PAGINATION_COUNT_CACHE_TIMEOUT = int(
+    os.getenv('PAGINATION_COUNT_CACHE_TIMEOUT', 0)
+)
+
+# Метрики и журнал медленных запросов; заголовок Server-Timing
+# отдаётся только при DEBUG и сотрудникам.
+REQUEST_PROFILING = (
+    os.getenv('REQUEST_PROFILING', 'True').lower() == 'true'
+)
+# Порог журнала медленных запросов в миллисекундах, 0 — выключен.
+SLOW_REQUEST_THRESHOLD = int(os.getenv('SLOW_REQUEST_THRESHOLD', 0))
+
+IMAGE_PIPELINE_SYNC = (
+    os.getenv('IMAGE_PIPELINE_SYNC', 'False').lower() == 'true'
+)
+IMAGE_PIPELINE_WORKERS = int(os.getenv('IMAGE_PIPELINE_WORKERS', 2))
+IMAGE_RENDITION_FORMAT = os.getenv('IMAGE_RENDITION_FORMAT', 'WEBP').upper()
+# Неверный формат обнаруживается при запуске, а не при первой загрузке.
+if IMAGE_RENDITION_FORMAT not in ('WEBP', 'JPEG'):
+    raise ImproperlyConfigured(
+        f'IMAGE_RENDITION_FORMAT должен быть WEBP или JPEG, '
+        f'получено {IMAGE_RENDITION_FORMAT!r}'
+    )
+IMAGE_RENDITION_QUALITY = int(os.getenv('IMAGE_RENDITION_QUALITY', 80))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
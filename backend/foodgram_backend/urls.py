@@ -6,7 +6,7 @@ from djoser.views import TokenCreateView, TokenDestroyView
 from rest_framework import routers
 
 from foodgram.views import (IngredientViewSet, RecipeViewSet, TagViewSet,
-                            UserViewSet, short_url_redirect)
+                            UserViewSet, metrics, short_url_redirect)
 
 router = routers.DefaultRouter()
 router.register('users', UserViewSet, basename='users')
@@ -28,9 +28,16 @@ urlpatterns = [
         TokenDestroyView.as_view(),
         name='logout'
     ),
-    path('s/<str:code>/', short_url_redirect, name='recipe-short-link')
+    path('s/<str:code>/', short_url_redirect, name='recipe-short-link'),
+    # nginx не проксирует этот путь: метрики доступны только внутри сети.
+    path('metrics/', metrics, name='metrics'),
 ]
 
+if settings.ASYNC_READ_VIEWS:
+    from foodgram import async_views
+
+    urlpatterns = async_views.urlpatterns + urlpatterns
+
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL,
                           document_root=settings.MEDIA_ROOT)